@@ -1,21 +1,65 @@
+import inspect
 from abc import ABCMeta, abstractmethod
+from contextlib import asynccontextmanager
 
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import AFTER_COMMIT, REQUEST_SCOPED, async_session, run_callback
+from app.metrics import timed_dao_call
 
 
 class BaseDAO(metaclass=ABCMeta):
+    """Every DAO method takes an optional `session`. Passing the request session
+    (app.database.get_session) makes all calls of one request share a connection
+    and a single commit; without it a method opens and commits its own session."""
     model = None
 
+    def __init_subclass__(cls, **kwargs):
+        # Public async classmethods are timed as efficore_dao_seconds{call="<Dao>.<method>"}.
+        super().__init_subclass__(**kwargs)
+        for name, attr in list(vars(cls).items()):
+            if isinstance(attr, classmethod) and not name.startswith("_") and inspect.iscoroutinefunction(attr.__func__):
+                setattr(cls, name, classmethod(timed_dao_call(f"{cls.__name__}.{name}", attr.__func__)))
+
+    @staticmethod
+    @asynccontextmanager
+    async def use_session(session: AsyncSession | None = None):
+        if session is not None:
+            yield session
+            return
+        async with async_session() as own:
+            yield own
+
+    @staticmethod
+    async def commit(session: AsyncSession):
+        # The request session is committed once by get_session; flush so ids and
+        # RETURNING values are available now.
+        if session.info.get(REQUEST_SCOPED):
+            await session.flush()
+        else:
+            await session.commit()
+
+    @staticmethod
+    async def after_commit(session: AsyncSession, callback):
+        """Runs the zero-argument callable (awaiting it if it is a coroutine function) once the write
+        is committed: right away for a DAO-owned session (call it after `commit`), after the
+        request commit otherwise."""
+        if session.info.get(REQUEST_SCOPED):
+            session.info.setdefault(AFTER_COMMIT, []).append(callback)
+        else:
+            await run_callback(callback)
+
 
     @abstractmethod
-    async def add_one(cls, user_data, hashed_pass):
+    async def add_one(cls, user_data, hashed_pass, session: AsyncSession | None = None):
         raise NotImplementedError()
 
 
     @abstractmethod
-    async def get_by_filter_or_none(cls, **filter_by):
+    async def get_by_filter_or_none(cls, session: AsyncSession | None = None, **filter_by):
         raise NotImplementedError()
 
 
     @abstractmethod
-    async def get_by_id(cls, user_id):
+    async def get_by_id(cls, user_id, session: AsyncSession | None = None):
         raise NotImplementedError()
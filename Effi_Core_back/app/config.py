@@ -1,6 +1,11 @@
-import os, torch
+import os
+from typing import Literal
+
 from pydantic_settings import BaseSettings
 
+# Accepted TEMPLATE_SCORING values; anything else fails at settings load.
+TemplateScoring = Literal["max", "mean", "centroid"]
+
 file_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(file_dir)
 dotenv_path = os.path.join(parent_dir, ".env")
@@ -41,6 +46,12 @@ class Settings(BaseSettings):
     CONFIRM_EMAIL_TOKEN_EXP: int = 24
     RESET_TOKEN_EXP: int = 24
 
+    #Password and PIN hashing (bcrypt runs off the event loop; PASSWORD_HASH_WORKERS=0 - number of CPUs)
+    #PASSWORD_HASH_QUEUE: calls waiting for a worker before new ones get 503; BCRYPT_ROUNDS applies to new hashes
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 0
+    PASSWORD_HASH_QUEUE: int = 64
+
     #Face settings
     MAX_FILE_SIZE_MB: int
     IMG_SIZE: int
@@ -48,7 +59,94 @@ class Settings(BaseSettings):
     EMBED_DIM:int
     THRESHOLD_DEFAULT: float
     DEVICE: str = ''
-
+    FAST_PREPROCESS: bool = False
+
+    #Embedding cache settings (MODEL_VERSION: empty - derived from the engine and weights file)
+    MODEL_VERSION: str = ''
+    EMBEDDING_CACHE_MB: float = 32
+    EMBEDDING_CACHE_TTL_S: float = 300
+
+    #Authenticated principal cache (per process; PRINCIPAL_CACHE_TTL_S=0 - look the user up on every request)
+    PRINCIPAL_CACHE_SIZE: int = 10000
+    PRINCIPAL_CACHE_TTL_S: float = 30
+
+    #Prometheus text metrics at GET /metrics (per process, labeled with the worker pid);
+    #scraped with "Authorization: Bearer METRICS_TOKEN", without a token - from loopback clients only
+    METRICS_ENABLED: bool = True
+    METRICS_TOKEN: str = ""
+
+    #Verified JWT payload cache (per process, entries live until the token's exp; JWT_CACHE_SIZE=0 - decode every request)
+    JWT_CACHE_SIZE: int = 10000
+
+    #Face cache in Redis, shared by workers and nodes (FACE_CACHE_TTL_S=0 - disabled; db 0 is the Celery broker)
+    FACE_CACHE_TTL_S: float = 300
+    FACE_CACHE_REDIS_DB: int = 1
+
+    #Face gallery settings (1:N /face/identify)
+    GALLERY_ENABLED: bool = True
+    GALLERY_REFRESH_S: float = 60
+
+    #Face templates per user (slot 0 is the one /face/create, /face/put and bulk enrollment write)
+    #TEMPLATE_SCORING for /face/verify: max - nearest template, mean - mean distance, centroid - distance to the normalised mean
+    MAX_TEMPLATES: int = 5
+    TEMPLATE_SCORING: TemplateScoring = 'max'
+
+    #Bulk enrollment settings (/face/enroll/bulk, admin only)
+    ENROLL_BATCH_SIZE: int = 32
+    ENROLL_MAX_ITEMS: int = 1000
+
+    #Request body limits, enforced while the body arrives (MAX_REQUEST_SIZE_MB=0 - MAX_FILE_SIZE_MB + 1 for form fields)
+    MAX_REQUEST_SIZE_MB: int = 0
+    ENROLL_MAX_REQUEST_SIZE_MB: int = 512
+
+    #Embedding storage: bytes - LargeBinary only, pgvector - also a vector(EMBED_DIM) column compared inside Postgres
+    #PGVECTOR_INDEX: hnsw or ivfflat (used by the migration), PGVECTOR_SEARCH: hnsw.ef_search / ivfflat.probes
+    EMBEDDING_STORE: str = 'bytes'
+    PGVECTOR_INDEX: str = 'hnsw'
+    PGVECTOR_SEARCH: int = 40
+    #Stored embedding payload: float32, float16 or int8 (scaled); rows in any format, including headerless float32, are read
+    EMBEDDING_CODEC: str = 'float16'
+
+    #ANN index for the gallery (IVF-PQ, used once the gallery has GALLERY_ANN_MIN_SIZE rows; ANN_NLIST=0 - 4*sqrt(N);
+    #retrained on reload once the row count moved by more than ANN_RETRAIN_CHANGE since training)
+    GALLERY_ANN_MIN_SIZE: int = 100000
+    ANN_NLIST: int = 0
+    ANN_M: int = 16
+    ANN_NPROBE: int = 8
+    ANN_REFINE: int = 16
+    ANN_RETRAIN_CHANGE: float = 0.2
+
+    #Model startup settings (WARMUP_BATCH_SIZES: comma separated, empty - 1 and BATCH_MAX_SIZE)
+    MODEL_EAGER_LOAD: bool = True
+    WARMUP_BATCH_SIZES: str = ''
+    WARMUP_ROUNDS: int = 2
+
+    #Inference engine settings: eager | torchscript | onnx (onnx runs on CPU via onnxruntime)
+    MODEL_ENGINE: str = 'eager'
+    MODEL_TORCHSCRIPT_PATH: str = 'weights/embedding_net.ts'
+    MODEL_ONNX_PATH: str = 'weights/embedding_net.onnx'
+    ONNX_INTRA_OP_THREADS: int = 0
+
+    #INT8 quantization settings (MODEL_ENGINE=int8)
+    MODEL_INT8_PATH: str = 'weights/embedding_net_int8.ts'
+    QUANT_BACKEND: str = 'x86'
+    QUANT_EER_TOLERANCE: float = 0.01
+
+    #Inference batching settings (BATCH_MAX_SIZE <= 1 disables batching)
+    BATCH_MAX_SIZE: int = 8
+    BATCH_MAX_WAIT_MS: float = 5.0
+
+    #Inference admission control: INFERENCE_LIMITS - embeddings computed at once per endpoint,
+    #INFERENCE_QUEUE - requests waiting per endpoint before 503, INFERENCE_DEADLINE_MS - default client deadline (0 - none)
+    INFERENCE_LIMITS: str = 'verify:8,identify:4,create:2,put:2,templates:2'
+    INFERENCE_QUEUE: int = 32
+    INFERENCE_DEADLINE_MS: int = 10000
+
+    #Model server settings (empty MODEL_SERVER_SOCKET keeps inference in-process)
+    MODEL_SERVER_SOCKET: str = ''
+    MODEL_SERVER_REPLICAS: int = 1
+    MODEL_SERVER_CONNECTIONS: int = 4
+    MODEL_SERVER_THREADS: int = 0
 
     def get_db_url(self):
         DATABASE_URL = f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASS}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
@@ -57,7 +155,20 @@ class Settings(BaseSettings):
     def get_max_file_size(self):
         return (self.MAX_FILE_SIZE_MB * 1024 * 1024)
 
+    def get_max_request_size(self):
+        return (self.MAX_REQUEST_SIZE_MB or self.MAX_FILE_SIZE_MB + 1) * 1024 * 1024
+
+    def get_inference_limits(self) -> dict[str, int]:
+        limits = (item.split(':') for item in self.INFERENCE_LIMITS.split(',') if item.strip())
+        return {name.strip(): int(limit) for name, limit in limits}
+
+    def get_warmup_batch_sizes(self):
+        if self.WARMUP_BATCH_SIZES:
+            return [int(size) for size in self.WARMUP_BATCH_SIZES.split(',') if size.strip()]
+        return sorted({1, max(1, self.BATCH_MAX_SIZE)})
+
     def get_device(self):
+        import torch  # here, so modules that only read settings do not load torch
         if self.DEVICE is None:
             if self.DEVICE.lower() == "mps" and torch.backends.mps.is_available():
                 return torch.device("mps")
@@ -71,6 +182,7 @@ class Settings(BaseSettings):
         return torch.device("cpu")
 
     def get_autcast_kwargs(self):
+        import torch
         return dict(device_type="mps", dtype=torch.float16, enabled=(self.get_device() == "mps"))
 
 
@@ -1,7 +1,12 @@
+import inspect
+
+from fastapi import Depends
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from app.config import settings
+from app.metrics import count_db_checkout
 
 
 engine = create_async_engine(settings.get_db_url(), echo=False)
@@ -13,4 +18,36 @@ async_session = sessionmaker(
 )
 
 session = async_session()
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
+
+REQUEST_SCOPED = "request_scoped"
+AFTER_COMMIT = "after_commit"
+
+@event.listens_for(engine.sync_engine, "checkout")
+def _count_checkout(*_):
+    count_db_checkout()
+
+
+async def get_session():
+    """One session (and at most one pooled connection) per request, committed once
+    after the endpoint returns and before the response is sent."""
+    async with async_session() as session:
+        session.info[REQUEST_SCOPED] = True
+        try:
+            yield session
+        except Exception:
+            await session.rollback()
+            raise
+        if session.in_transaction():
+            await session.commit()
+        for callback in session.info.pop(AFTER_COMMIT, ()):
+            await run_callback(callback)
+
+
+async def run_callback(callback):
+    result = callback()
+    if inspect.isawaitable(result):
+        await result
+
+
+request_session = Depends(get_session, scope="function")
@@ -98,4 +98,55 @@ NoOnSMTP = HTTPException(
 CantSaveEmb = HTTPException(
     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
     detail="Не удалось сохранить эмбеддинг"
-)
\ No newline at end of file
+)
+
+GalleryNotLoaded = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Галерея лиц ещё не загружена"
+)
+AdminRequired = HTTPException(
+    status_code=status.HTTP_403_FORBIDDEN,
+    detail="Недостаточно прав"
+)
+
+InvalidEnrollBatch = HTTPException(
+    status_code=status.HTTP_400_BAD_REQUEST,
+    detail="Передайте либо files и user_ids одинаковой длины, либо zip-архив"
+)
+
+EnrollBatchTooLarge = HTTPException(
+    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+    detail="Слишком много изображений в пакете"
+)
+
+TooManyTemplates = HTTPException(
+    status_code=status.HTTP_409_CONFLICT,
+    detail="Достигнут лимит шаблонов лица"
+)
+
+InvalidTemplateSlot = HTTPException(
+    status_code=status.HTTP_400_BAD_REQUEST,
+    detail="Недопустимый номер шаблона"
+)
+
+InferenceOverloaded = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Сервис распознавания перегружен, повторите запрос позже",
+    headers={"Retry-After": "1"},
+)
+
+DeadlineExceeded = HTTPException(
+    status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+    detail="Истекло время ожидания обработки запроса"
+)
+
+HashingOverloaded = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Сервер перегружен, повторите запрос позже",
+    headers={"Retry-After": "1"},
+)
+
+MetricsAccessDenied = HTTPException(
+    status_code=status.HTTP_403_FORBIDDEN,
+    detail='Нет доступа к метрикам'
+)
@@ -0,0 +1,134 @@
+"""Pre-fork launcher: load and warm up the model once, then fork uvicorn workers.
+
+    python -m app.launcher --host 0.0.0.0 --port 8000 --workers 4
+
+Workers inherit the loaded SiameseNet and share its weight pages copy-on-write
+instead of each loading a private copy on the first request. The parent warms up
+on a single intra-op thread: an OpenMP pool started before fork is not usable in
+the children and hangs their first forward pass.
+"""
+import argparse
+import asyncio
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+import torch
+import uvicorn
+
+from app.config import settings
+from app.database import engine
+from app.main import app, create_tables
+from app.verification.model_dlm import prepare_model
+
+
+# Respawn delay after a worker dies young, doubled per consecutive early death.
+RESPAWN_BACKOFF_S = 0.5
+RESPAWN_BACKOFF_MAX_S = 30.0
+# A worker that lived this long resets the backoff.
+RESPAWN_HEALTHY_S = 10.0
+
+
+async def prepare_database():
+    # Create the schema once here instead of racing in every worker, and drop the
+    # pooled connections so no socket is shared with the forked children.
+    await create_tables()
+    await engine.dispose()
+    # Inherited by the workers: their startup hook skips create_tables.
+    app.state.schema_ready = True
+
+
+def bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock: socket.socket, torch_threads: int, log_level: str):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    if torch_threads > 0:
+        torch.set_num_threads(torch_threads)
+    config = uvicorn.Config(app, log_level=log_level)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def spawn(sock: socket.socket, torch_threads: int, log_level: str) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(sock, torch_threads, log_level)
+        except BaseException:
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--torch-threads", type=int, default=0,
+                        help="intra-op threads per worker, 0 - cpu_count // workers")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    torch_threads = args.torch_threads or max(1, (os.cpu_count() or 1) // args.workers)
+    started = time.perf_counter()
+    torch.set_num_threads(1)
+    prepare_model()
+    print(f"model loaded and warmed up for batch sizes {settings.get_warmup_batch_sizes()} "
+          f"in {time.perf_counter() - started:.2f}s", flush=True)
+
+    asyncio.run(prepare_database())
+    sock = bind_socket(args.host, args.port, args.backlog)
+    # Keep the gc from touching (and un-sharing) pages of everything loaded so far.
+    gc.collect()
+    gc.freeze()
+
+    workers = {spawn(sock, torch_threads, args.log_level): time.monotonic() for _ in range(args.workers)}
+    stopping = False
+    failures = 0
+
+    def stop(signum, _frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        lived = time.monotonic() - workers.pop(pid, time.monotonic())
+        if stopping:
+            continue
+        failures = 0 if lived >= RESPAWN_HEALTHY_S else failures + 1
+        delay = min(RESPAWN_BACKOFF_S * 2 ** (failures - 1), RESPAWN_BACKOFF_MAX_S) if failures else 0
+        print(f"worker {pid} exited with status {status} after {lived:.1f}s, respawning in {delay:.1f}s",
+              file=sys.stderr, flush=True)
+        time.sleep(delay)
+        if not stopping:
+            workers[spawn(sock, torch_threads, args.log_level)] = time.monotonic()
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,26 @@
+import asyncio
+import hmac
 import uvicorn
+from anyio import to_thread
 from starlette.middleware.cors import CORSMiddleware
 from app.user.router import router as user_router
 from app.verification.router import router as verification_router
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy import text
+from .config import settings
 from .database import engine, Base
+from .exceptions import MetricsAccessDenied
+from .metrics import GAUGE_SOURCES, MetricsMiddleware, render
+from .user.hashing import hash_executor
+from .user.principal_cache import principal_cache
+from .user.token_cache import token_cache
+from .verification.embedding_cache import embedding_cache
+from .verification.face_cache import face_cache
+from .verification.gallery import face_gallery
+from .verification.admission import inference_gates
+from .verification.model_dlm import batch_stats, is_model_ready, prepare_model_async
+from .verification.upload import BodySizeLimitMiddleware
 app = FastAPI()
 
 app.include_router(user_router)
@@ -19,6 +36,13 @@ origins = [
     "http://127.0.0.1:8080",
 ]
 
+# Starlette runs the last added middleware first: CORS wraps the size limit, so its 413 carries CORS headers.
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    default=settings.get_max_request_size(),
+    limits={"/face/enroll/bulk": settings.ENROLL_MAX_REQUEST_SIZE_MB * 1024 * 1024},
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -28,10 +52,101 @@ app.add_middleware(
                    'Access-Contol-Allow-Origin', 'Authorization' ]
 )
 
-@app.on_event("startup")
-async def on_startup():
+
+async def create_tables():
     async with engine.begin() as conn:
+        if settings.EMBEDDING_STORE == "pgvector":
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
         await conn.run_sync(Base.metadata.create_all)
+        if settings.EMBEDDING_STORE == "pgvector":
+            # create_all does not add columns to an existing table; that is the migration's job.
+            column = await conn.execute(text(
+                "SELECT 1 FROM information_schema.columns "
+                "WHERE table_name = 'face_embeddings' AND column_name = 'embedding_vec'"
+            ))
+            if column.scalar() is None:
+                raise RuntimeError("EMBEDDING_STORE=pgvector needs face_embeddings.embedding_vec, run `alembic upgrade head`")
+
+
+@app.on_event("startup")
+async def on_startup():
+    # The pre-fork launcher has already created the schema in the parent.
+    if not getattr(app.state, "schema_ready", False):
+        await create_tables()
+    if settings.MODEL_EAGER_LOAD:
+        # Load and warm up in the background: /health/live answers right away,
+        # /health/ready flips once the first-request latency is steady-state.
+        app.state.model_warmup = asyncio.create_task(prepare_model_async())
+    if settings.GALLERY_ENABLED:
+        app.state.gallery_refresh = asyncio.create_task(face_gallery.run_refresh(settings.GALLERY_REFRESH_S))
+
+
+@app.get("/health/live")
+async def health_live():
+    return {"live": True}
+
+
+@app.get("/health/ready")
+async def health_ready():
+    if not is_model_ready():
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"ready": False})
+    return {"ready": True}
+
+
+@app.get("/health/inference")
+async def health_inference():
+    # Per-endpoint admission: running/waiting are the current queue depth, rejected/expired are totals.
+    gates = {name: gate.stats() for name, gate in inference_gates.items()}
+    return {**gates, "batching": {device: stats.snapshot() for device, stats in batch_stats().items()}}
+
+
+def runtime_gauges():
+    limiter = to_thread.current_default_thread_limiter()
+    pool = engine.pool
+    caches = {"principal": principal_cache, "token": token_cache, "face": face_cache, "embedding": embedding_cache}
+    gates = inference_gates.items()
+    batches = batch_stats().items()
+    return [
+        ("efficore_threadpool_busy", "gauge", "Threads of the run_in_threadpool pool in use.", [({}, limiter.borrowed_tokens)]),
+        ("efficore_threadpool_size", "gauge", "Size of the run_in_threadpool pool.", [({}, limiter.total_tokens)]),
+        ("efficore_hash_pool_pending", "gauge", "Password/PIN hashing calls running or waiting.", [({}, hash_executor.pending)]),
+        ("efficore_hash_pool_rejected_total", "counter", "Hashing calls rejected with 503.", [({}, hash_executor.rejected)]),
+        ("efficore_db_pool_checked_out", "gauge", "DB connections checked out of the pool.", [({}, pool.checkedout())]),
+        ("efficore_db_pool_size", "gauge", "DB pool size.", [({}, pool.size())]),
+        ("efficore_db_pool_overflow", "gauge", "DB connections open beyond the pool size.", [({}, max(0, pool.overflow()))]),
+        ("efficore_inference_running", "gauge", "Embeddings being computed.", [({"endpoint": n}, g.running) for n, g in gates]),
+        ("efficore_inference_waiting", "gauge", "Requests waiting for an inference slot.", [({"endpoint": n}, g.waiting) for n, g in gates]),
+        ("efficore_inference_rejected_total", "counter", "Requests rejected with 503, queue full.", [({"endpoint": n}, g.rejected) for n, g in gates]),
+        ("efficore_inference_expired_total", "counter", "Requests dropped with 504, deadline passed.", [({"endpoint": n}, g.expired) for n, g in gates]),
+        ("efficore_batches_total", "counter", "Forward passes run by the micro-batcher.", [({"device": d}, b.batches) for d, b in batches]),
+        ("efficore_batch_items_total", "counter", "Images in micro-batched forward passes.", [({"device": d}, b.items) for d, b in batches]),
+        ("efficore_batch_failed_total", "counter", "Micro-batched forward passes that raised.", [({"device": d}, b.failed_batches) for d, b in batches]),
+        ("efficore_batch_size_total", "counter", "Micro-batched forward passes by batch size.",
+         [({"device": d, "size": size}, n) for d, b in batches for size, n in enumerate(b.size_hist) if n]),
+        ("efficore_batch_queue_wait_seconds_total", "counter", "Time images waited for their batch, summed.",
+         [({"device": d}, b.wait_total_ms / 1000) for d, b in batches]),
+        ("efficore_batch_queue_wait_max_seconds", "gauge", "Longest wait of an image for its batch.",
+         [({"device": d}, b.wait_max_ms / 1000) for d, b in batches]),
+        ("efficore_cache_hits_total", "counter", "Cache hits.", [({"cache": n}, c.hits) for n, c in caches.items()]),
+        ("efficore_cache_misses_total", "counter", "Cache misses.", [({"cache": n}, c.misses) for n, c in caches.items()]),
+    ]
+
+
+GAUGE_SOURCES.append(runtime_gauges)
+
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics(request: Request):
+        if settings.METRICS_TOKEN:
+            expected = f"Bearer {settings.METRICS_TOKEN}".encode()
+            allowed = hmac.compare_digest(request.headers.get("authorization", "").encode(), expected)
+        else:
+            allowed = request.client is not None and request.client.host in ("127.0.0.1", "::1")
+        if not allowed:
+            raise MetricsAccessDenied
+        return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
 
 
 if __name__ == "__main__":
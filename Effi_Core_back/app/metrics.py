@@ -0,0 +1,147 @@
+"""Hot-path metrics in Prometheus text format, kept in process memory and served by GET /metrics.
+
+Recording a value is a dict lookup, a bisect and two additions under an uncontended lock,
+so it stays on in production. Every observation is labeled with the endpoint (route path)
+of the request it happened in; work outside a request is labeled "background". Gauges
+are read from their sources when /metrics is scraped. Every series also carries the
+worker's pid, so counters of different worker processes behind one port stay apart.
+"""
+import bisect
+import functools
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_scope: ContextVar[dict | None] = ContextVar("metrics_scope", default=None)
+# DB pool checkouts of the current request, bumped by the pool listener in app.database.
+_checkouts: ContextVar[list[int] | None] = ContextVar("metrics_checkouts", default=None)
+
+
+def current_endpoint() -> str:
+    scope = _scope.get()
+    if scope is None:
+        return "background"
+    route = scope.get("route")
+    # Unrouted paths are not used as label values, so scanners cannot blow up the series count.
+    return route.path if route is not None else "unmatched"
+
+
+def _labels(names: tuple[str, ...], values: tuple) -> str:
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple[str, ...], buckets: tuple[float, ...] = BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def render(self, worker: int) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for labels, counts, total in sorted(series):
+            base = _labels(("worker", *self.labels), (worker, *labels))
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{base}}} {total}")
+            lines.append(f"{self.name}_count{{{base}}} {cumulative}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram("efficore_request_seconds", "Request latency.", ("endpoint",))
+STAGE_SECONDS = Histogram("efficore_stage_seconds", "Time spent in a hot-path stage of a request.", ("endpoint", "stage"))
+DAO_SECONDS = Histogram("efficore_dao_seconds", "Latency of DAO calls.", ("endpoint", "call"))
+DB_CHECKOUTS = Histogram("efficore_db_checkouts", "DB pool checkouts per request.", ("endpoint",), (0, 1, 2, 3, 5, 10))
+HISTOGRAMS = (REQUEST_SECONDS, STAGE_SECONDS, DAO_SECONDS, DB_CHECKOUTS)
+
+
+def count_db_checkout():
+    counter = _checkouts.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+class timed:
+    """`with timed("decode"):` records the block in efficore_stage_seconds."""
+    __slots__ = ("stage", "t0")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc):
+        STAGE_SECONDS.observe(time.perf_counter() - self.t0, current_endpoint(), self.stage)
+
+
+def timed_dao_call(call: str, fn):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            DAO_SECONDS.observe(time.perf_counter() - t0, current_endpoint(), call)
+    return wrapper
+
+
+# Zero-argument callables returning [(name, type, help, [(labels dict, value), ...])], registered by app.main.
+GAUGE_SOURCES = []
+
+
+def render() -> str:
+    lines = []
+    worker = os.getpid()
+    for histogram in HISTOGRAMS:
+        lines += histogram.render(worker)
+    for source in GAUGE_SOURCES:
+        for name, kind, help, samples in source():
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            for labels, value in samples:
+                base = _labels(("worker", *labels), (worker, *labels.values()))
+                lines.append(f"{name}{{{base}}} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """Makes the request scope visible to current_endpoint() and records the request latency.
+    The router fills scope["route"] in place, so the label is the matched route path."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = _scope.set(scope)
+        counter = [0]
+        checkouts_token = _checkouts.set(counter)
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            endpoint = current_endpoint()
+            REQUEST_SECONDS.observe(time.perf_counter() - t0, endpoint)
+            DB_CHECKOUTS.observe(counter[0], endpoint)
+            _checkouts.reset(checkouts_token)
+            _scope.reset(token)
@@ -1,13 +1,14 @@
 import jwt
-from jose import JWTError
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from app.config import settings
-from app.exceptions import IncorrectFormatJWTException
+from app.exceptions import IncorrectFormatJWTException, JWTExpiredException
+from app.metrics import timed
+from app.user.hashing import hash_executor
 from typing import Literal
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
 
 
 class JwtController():
@@ -20,11 +21,21 @@ class JwtController():
     def verify_password(cls, plain_password, hashed_password):
         return pwd_context.verify(plain_password, hashed_password)
 
+    @classmethod
+    async def get_password_hash_async(cls, password) -> str:
+        return await hash_executor.run(pwd_context.hash, password)
+
+    @classmethod
+    async def verify_password_async(cls, plain_password, hashed_password) -> bool:
+        return await hash_executor.run(pwd_context.verify, plain_password, hashed_password)
+
     @classmethod
     def decode_jwt(cls, token: str) -> dict:
         try:
             return jwt.decode(token, key=settings.SECRET_KEY, algorithms=settings.HASH)
-        except JWTError:
+        except jwt.ExpiredSignatureError:
+            raise JWTExpiredException
+        except jwt.InvalidTokenError:
             raise IncorrectFormatJWTException
 
     @classmethod
@@ -46,12 +57,13 @@ class JwtController():
         to_encode = data.copy()
         expire = datetime.utcnow() + time_to_add
         to_encode.update({'exp': expire, 'token_type': token_type})
-        encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.HASH)
+        with timed("token_create"):
+            encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.HASH)
         return encoded_jwt
 
     @classmethod
     async def authenticate_user(cls, password: str, user_password):
-        if cls.verify_password(password, user_password):
+        if await cls.verify_password_async(password, user_password):
             return True
         return False
 
@@ -2,8 +2,9 @@ from sqlalchemy import insert
 
 from app.abstract_objects.abc_dao import BaseDAO
 from app.user.models import Users
+from app.user.principal_cache import principal_cache
 from app.config import settings
-from app.database import async_session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql import select, update
 
 
@@ -12,8 +13,8 @@ class UserDao(BaseDAO):
 
 
     @classmethod
-    async def add_one(cls, user_data, hashed_pass):
-        async with async_session() as session:
+    async def add_one(cls, user_data, hashed_pass, session: AsyncSession | None = None):
+        async with cls.use_session(session) as session:
             if settings.SMTP:
                 query = (
                     insert(cls.model)
@@ -42,34 +43,38 @@ class UserDao(BaseDAO):
 
             result = await session.execute(query)
             new_id = result.scalar_one_or_none()
-            await session.commit()
+            await cls.commit(session)
             return new_id
 
     @classmethod
-    async def get_by_filter_or_none(cls, **filter_by):
-        async with async_session() as session:
+    async def get_by_filter_or_none(cls, session: AsyncSession | None = None, **filter_by):
+        async with cls.use_session(session) as session:
             query = select(cls.model).filter_by(**filter_by)
             result = await session.execute(query)
             return result.scalar_one_or_none()
 
     @classmethod
-    async def get_by_id(cls, user_id):
-        async with async_session() as session:
+    async def get_by_id(cls, user_id, session: AsyncSession | None = None):
+        async with cls.use_session(session) as session:
             user_id = int(user_id)
             query = select(cls.model).filter_by(id=user_id)
             result = await session.execute(query)
             return result.scalar_one()
 
     @classmethod
-    async def confirm_email(cls, email):
-        async with async_session() as session:
-            query = update(cls.model).filter_by(email=email).values(email_confirmed=True)
-            await session.execute(query)
-            await session.commit()
+    async def confirm_email(cls, email, session: AsyncSession | None = None):
+        async with cls.use_session(session) as session:
+            query = update(cls.model).filter_by(email=email).values(email_confirmed=True).returning(cls.model.id)
+            result = await session.execute(query)
+            await cls.commit(session)
+            user_ids = result.scalars().all()
+            await cls.after_commit(session, lambda: principal_cache.invalidate(*user_ids))
 
     @classmethod
-    async def reset_password(cls, email, hashed_password):
-        async with async_session() as session:
-            query = update(cls.model).filter_by(email=email).values(hashed_password=hashed_password)
-            await session.execute(query)
-            await session.commit()
\ No newline at end of file
+    async def reset_password(cls, email, hashed_password, session: AsyncSession | None = None):
+        async with cls.use_session(session) as session:
+            query = update(cls.model).filter_by(email=email).values(hashed_password=hashed_password).returning(cls.model.id)
+            result = await session.execute(query)
+            await cls.commit(session)
+            user_ids = result.scalars().all()
+            await cls.after_commit(session, lambda: principal_cache.invalidate(*user_ids))
\ No newline at end of file
@@ -1,16 +1,21 @@
 from datetime import datetime
 from fastapi import Depends
 from fastapi.security import (HTTPBearer, HTTPAuthorizationCredentials)
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.config import settings
+from app.database import request_session
 from app.exceptions import (
     JWTExpiredException,
     NoExistUserException,
     IncorrectTokenType,
-    NoGivenToken
+    NoGivenToken,
+    AdminRequired
 )
 from app.user.dao import UserDao
 from app.user.models import Users
 from app.user.auth import JwtController
+from app.user.principal_cache import Principal, principal_cache
+from app.user.token_cache import token_cache
 
 http_bearer = HTTPBearer(auto_error=False)
 
@@ -21,9 +26,13 @@ def get_credentials(credentials: HTTPAuthorizationCredentials = Depends(http_bea
         raise NoGivenToken
 
 async def get_payload(token: str = Depends(get_credentials)):
-    return JwtController.decode_jwt(token)
+    payload = token_cache.get(token)
+    if payload is None:
+        payload = JwtController.decode_jwt(token)
+        token_cache.put(token, payload)
+    return payload
 
-async def get_current_user_to_refresh(payload: dict = Depends(get_payload)) -> Users:
+async def get_current_user_to_refresh(payload: dict = Depends(get_payload), session: AsyncSession = request_session) -> Users:
     token_type: str = payload.get('token_type')
     expire: str = payload.get('exp')
     if token_type != settings.REFRESH_TOKEN:
@@ -33,12 +42,12 @@ async def get_current_user_to_refresh(payload: dict = Depends(get_payload)) -> U
     user_id: str = payload.get('sub')
     if not user_id:
         raise NoExistUserException
-    user = await UserDao.get_by_id(user_id)
+    user = await UserDao.get_by_id(user_id, session=session)
     if not user or not user.is_active:
         raise NoExistUserException
     return user
 
-async def get_current_user_to_access(payload: dict = Depends(get_payload)) -> Users:
+async def get_current_user_to_access(payload: dict = Depends(get_payload), session: AsyncSession = request_session) -> Principal:
     token_type: str = payload.get('token_type')
     expire: str = payload.get('exp')
     if token_type != settings.ACCESS_TOKEN:
@@ -48,7 +57,18 @@ async def get_current_user_to_access(payload: dict = Depends(get_payload)) -> Us
     user_id: str = payload.get('sub')
     if not user_id:
         raise NoExistUserException
-    user = await UserDao.get_by_id(user_id)
-    if not user or not user.is_active:
+    user = principal_cache.get(int(user_id))
+    if user is None:
+        user = await UserDao.get_by_id(user_id, session=session)
+        if not user:
+            raise NoExistUserException
+        user = Principal.from_user(user)
+        principal_cache.put(user)
+    if not user.is_active:
         raise NoExistUserException
-    return user
\ No newline at end of file
+    return user
+
+async def get_current_admin(user: Principal = Depends(get_current_user_to_access)) -> Principal:
+    if not user.is_admin:
+        raise AdminRequired
+    return user
@@ -0,0 +1,58 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import settings
+from app.exceptions import HashingOverloaded
+from app.metrics import timed
+
+
+class BoundedExecutor:
+    """Thread pool for CPU-bound calls made from handlers, with a cap on calls in flight:
+    beyond `workers + queue` of them new calls fail with HashingOverloaded (503) instead of
+    queueing without limit. bcrypt releases the GIL, so the workers hash in parallel."""
+
+    def __init__(self, workers: int, queue: int, name: str):
+        self.workers = workers or os.cpu_count() or 1
+        self.queue = max(0, queue)
+        self.name = name
+        self._executor = None
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name)
+        return self._executor
+
+    async def run(self, fn, *args):
+        if self.pending >= self.workers + self.queue:
+            self.rejected += 1
+            raise HashingOverloaded
+        self.pending += 1
+        try:
+            with timed(self.name):
+                result = await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+        self.completed += 1
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue": self.queue,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+hash_executor = BoundedExecutor(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_QUEUE, "bcrypt")
@@ -14,7 +14,7 @@ class Users(Base):
     is_active = Column(Boolean, nullable=False, default=True)
     email_confirmed = Column(Boolean, nullable=False, default=False)
 
-    embedding = relationship("FaceEmbedding", back_populates="user", uselist=False)
+    embeddings = relationship("FaceEmbedding", back_populates="user")
 
     def __str__(self):
         return f'User - {self.login}'
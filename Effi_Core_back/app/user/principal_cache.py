@@ -0,0 +1,92 @@
+import time
+from collections import OrderedDict
+
+from app.config import settings
+
+
+class Principal:
+    """What the access dependency hands to endpoints: the fields of `Users` they read,
+    detached from any session."""
+    __slots__ = ("id", "login", "first_name", "last_name", "email", "is_admin", "is_active", "email_confirmed")
+
+    def __init__(self, id, login, first_name, last_name, email, is_admin, is_active, email_confirmed):
+        self.id = id
+        self.login = login
+        self.first_name = first_name
+        self.last_name = last_name
+        self.email = email
+        self.is_admin = is_admin
+        self.is_active = is_active
+        self.email_confirmed = email_confirmed
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(user.id, user.login, user.first_name, user.last_name, user.email,
+                   user.is_admin, user.is_active, user.email_confirmed)
+
+
+class PrincipalCache:
+    """Per-process LRU + TTL cache of principals keyed by user id.
+
+    Writes that change a user call `invalidate` (see UserDao); other workers
+    see the change once their entry expires, so the TTL bounds staleness.
+    """
+
+    def __init__(self, max_entries: int, ttl_s: float):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries: OrderedDict[int, tuple[float, Principal]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_s > 0
+
+    def get(self, user_id: int) -> Principal | None:
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, principal: Principal):
+        if not self.enabled:
+            return
+        self._entries[principal.id] = (time.monotonic() + self.ttl_s, principal)
+        self._entries.move_to_end(principal.id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, *user_ids: int):
+        for user_id in user_ids:
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+principal_cache = PrincipalCache(
+    max_entries=settings.PRINCIPAL_CACHE_SIZE,
+    ttl_s=settings.PRINCIPAL_CACHE_TTL_S,
+)
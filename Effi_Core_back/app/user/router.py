@@ -1,11 +1,13 @@
 from datetime import datetime
 from fastapi.routing import APIRouter
 from fastapi import Response, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.user.schema import SUserAuth, SUser, SUserRegister, TokenInfo, SUserReset, SOperationStatus, SUserChangePwd, \
     SUserId
 from app.user.auth import JwtController
 from app.user.dao import UserDao
 from app.config import settings
+from app.database import request_session
 from app.user.dependencies import get_current_user_to_access, get_current_user_to_refresh, http_bearer
 from app.user.models import Users
 from app.tasks.tasks import send_confirm_email, send_reset_password
@@ -27,8 +29,8 @@ async def get_info_about_user(user: SUser = Depends(get_current_user_to_access))
 
 
 @router.post('/login')
-async def login(response: Response,user_data: SUserAuth) -> TokenInfo:
-    user = await UserDao.get_by_filter_or_none(email=user_data.email)
+async def login(response: Response,user_data: SUserAuth, session: AsyncSession = request_session) -> TokenInfo:
+    user = await UserDao.get_by_filter_or_none(session=session, email=user_data.email)
     if not user:
         raise IncorrectUserEmailOrPasswordException
     elif not user.email_confirmed:
@@ -51,28 +53,28 @@ async def logout(response: Response):
 
 
 @router.post("/register")
-async def register_user(user_data: SUserRegister) -> SUserId:
-    existing_user = await UserDao.get_by_filter_or_none(email=user_data.email)
+async def register_user(user_data: SUserRegister, session: AsyncSession = request_session) -> SUserId:
+    existing_user = await UserDao.get_by_filter_or_none(session=session, email=user_data.email)
     if existing_user:
         if existing_user.login == user_data.login:
             raise UserLoginAlreadyExists
         if existing_user.email == user_data.email:
             raise UserAlreadyExists
-    hashed_pass = JwtController.get_password_hash(password=user_data.password)
+    hashed_pass = await JwtController.get_password_hash_async(password=user_data.password)
     if settings.SMTP:
         send_confirm_email.delay(user_data.email)
-    user_id = await UserDao.add_one(user_data, hashed_pass)
+    user_id = await UserDao.add_one(user_data, hashed_pass, session=session)
     return SUserId(id=user_id)
 
 
 @router.get('/confirm/email/{token:str}')
-async def confirm_email(token: str)-> SOperationStatus:
+async def confirm_email(token: str, session: AsyncSession = request_session)-> SOperationStatus:
     payload = JwtController.decode_jwt(token)
     expire = payload.get('exp')
     email = payload.get('email')
     if expire and (int(expire) <= datetime.utcnow().timestamp()):
         raise JWTExpiredException
-    await UserDao.confirm_email(email=email)
+    await UserDao.confirm_email(email=email, session=session)
     return SOperationStatus(status=True)
 
 @router.post(
@@ -96,8 +98,8 @@ async def refresh_jwt(
 
 
 @router.post("/reset")
-async def reset_password_first_step(user_email: SUserReset) -> SOperationStatus:
-    user = await UserDao.get_by_filter_or_none(email=user_email.email)
+async def reset_password_first_step(user_email: SUserReset, session: AsyncSession = request_session) -> SOperationStatus:
+    user = await UserDao.get_by_filter_or_none(session=session, email=user_email.email)
     if not user:
         raise NoExistUserException
     if not user.email_confirmed:
@@ -111,11 +113,11 @@ async def reset_password_first_step(user_email: SUserReset) -> SOperationStatus:
 @router.patch(
     '/reset/email_confirmed/{token:str}',
 )
-async def reset_password_last_step(token: str, user_data: SUserChangePwd) -> SOperationStatus:
+async def reset_password_last_step(token: str, user_data: SUserChangePwd, session: AsyncSession = request_session) -> SOperationStatus:
     payload = JwtController.decode_jwt(token)
     email = payload.get('email')
-    hashed_pass = JwtController.get_password_hash(password=user_data.password)
-    await UserDao.reset_password(email=email, hashed_password=hashed_pass)
+    hashed_pass = await JwtController.get_password_hash_async(password=user_data.password)
+    await UserDao.reset_password(email=email, hashed_password=hashed_pass, session=session)
     return SOperationStatus(status=True)
 
 
@@ -0,0 +1,82 @@
+import hashlib
+import heapq
+import time
+
+from app.config import settings
+
+
+def token_digest(token: str) -> bytes:
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+class TokenCache:
+    """Per-process cache of verified JWT payloads keyed by the token digest.
+
+    An entry lives until the token's own `exp`: it is never returned after that, and expired
+    entries are dropped on the next `put`. When full, the entry closest to expiry is evicted.
+    Only successful decodes are cached, so rejected tokens always take the full decode path
+    and raise as before. Tokens without `exp` are not cached.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: dict[bytes, tuple[float, dict]] = {}
+        self._expiry: list[tuple[float, bytes]] = []
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, token: str) -> dict | None:
+        entry = self._entries.get(token_digest(token))
+        if entry is None or entry[0] <= time.time():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def _pop_soonest(self):
+        _, key = heapq.heappop(self._expiry)
+        del self._entries[key]
+
+    def put(self, token: str, payload: dict):
+        exp = payload.get("exp")
+        if not self.enabled or exp is None:
+            return
+        key = token_digest(token)
+        if key in self._entries:
+            return
+        now = time.time()
+        while self._expiry and self._expiry[0][0] <= now:
+            self._pop_soonest()
+            self.expired += 1
+        if float(exp) <= now:
+            return
+        while len(self._entries) >= self.max_entries:
+            self._pop_soonest()
+            self.evictions += 1
+        self._entries[key] = (float(exp), payload)
+        heapq.heappush(self._expiry, (float(exp), key))
+
+    def clear(self):
+        self._entries.clear()
+        self._expiry.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "expired": self.expired,
+            "evictions": self.evictions,
+        }
+
+
+token_cache = TokenCache(settings.JWT_CACHE_SIZE)
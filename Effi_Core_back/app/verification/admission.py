@@ -0,0 +1,80 @@
+import asyncio
+
+from fastapi import Header
+
+from app.config import settings
+from app.exceptions import DeadlineExceeded, InferenceOverloaded
+
+
+class AdmissionGate:
+    """Admission control in front of inference for one endpoint.
+
+    At most `concurrency` requests compute at once and at most `queue` wait for a slot;
+    a request arriving beyond that fails right away with InferenceOverloaded (503 +
+    Retry-After) instead of piling up in the thread pool. A waiting request whose
+    deadline passes is dropped with DeadlineExceeded before any work is done for it.
+    """
+
+    def __init__(self, name: str, concurrency: int, queue: int):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.queue = max(0, queue)
+        self._slots = None
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.expired = 0
+
+    async def run(self, compute, deadline: float | None = None):
+        """Awaits the zero-argument coroutine function `compute` once a slot is free.
+        `deadline` is in event loop time (loop.time())."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        if self.running + self.waiting >= self.concurrency + self.queue:
+            self.rejected += 1
+            raise InferenceOverloaded
+        self.waiting += 1
+        try:
+            # A free slot is taken without suspending, so a passed deadline would not fire on its own.
+            if deadline is not None and asyncio.get_running_loop().time() >= deadline:
+                raise TimeoutError
+            async with asyncio.timeout_at(deadline):
+                await self._slots.acquire()
+        except TimeoutError:
+            self.expired += 1
+            raise DeadlineExceeded
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        self.admitted += 1
+        try:
+            return await compute()
+        finally:
+            self.running -= 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "queue": self.queue,
+            "running": self.running,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "expired": self.expired,
+        }
+
+
+inference_gates = {
+    name: AdmissionGate(name, concurrency, settings.INFERENCE_QUEUE)
+    for name, concurrency in settings.get_inference_limits().items()
+}
+
+
+async def request_deadline(x_request_timeout_ms: int | None = Header(None)) -> float | None:
+    """Loop-time deadline of the request: X-Request-Timeout-Ms from the client, else INFERENCE_DEADLINE_MS."""
+    timeout_ms = x_request_timeout_ms if x_request_timeout_ms is not None else settings.INFERENCE_DEADLINE_MS
+    if timeout_ms <= 0:
+        return None
+    return asyncio.get_running_loop().time() + timeout_ms / 1000
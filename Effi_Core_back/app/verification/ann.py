@@ -0,0 +1,176 @@
+import numpy as np
+
+KMEANS_SAMPLE = 65536
+ASSIGN_CHUNK = 8192
+
+
+def _assign(x: np.ndarray, c: np.ndarray) -> np.ndarray:
+    # argmin ||x - c||^2 == argmin (||c||^2 - 2 x.c); ||x||^2 is constant per row.
+    c_sq = np.einsum("ij,ij->i", c, c)
+    out = np.empty(len(x), dtype=np.int64)
+    for i in range(0, len(x), ASSIGN_CHUNK):
+        d = x[i:i + ASSIGN_CHUNK] @ c.T
+        d *= -2.0
+        d += c_sq
+        out[i:i + ASSIGN_CHUNK] = np.argmin(d, axis=1)
+    return out
+
+
+def kmeans(x: np.ndarray, k: int, iters: int = 15, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    if len(x) > KMEANS_SAMPLE:
+        x = x[rng.choice(len(x), KMEANS_SAMPLE, replace=False)]
+    k = min(k, len(x))
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(iters):
+        assign = _assign(x, centroids)
+        counts = np.bincount(assign, minlength=k)
+        empty = counts == 0
+        # Per-cluster sums via one sort + reduceat; np.add.at is an order of magnitude slower.
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        sums = np.add.reduceat(x[np.argsort(assign, kind="stable")], starts[~empty])
+        centroids[~empty] = sums / counts[~empty, None]
+        # Re-seed empty clusters from random points so every list stays usable.
+        centroids[empty] = x[rng.choice(len(x), int(empty.sum()), replace=False)]
+    return centroids
+
+
+class _InvertedList:
+    __slots__ = ("ids", "codes", "size")
+
+    def __init__(self, m: int):
+        self.ids = np.zeros(16, dtype=np.int64)
+        self.codes = np.zeros((16, m), dtype=np.uint8)
+        self.size = 0
+
+    def append(self, ids: np.ndarray, codes: np.ndarray):
+        need = self.size + len(ids)
+        if need > len(self.ids):
+            cap = max(need, 2 * len(self.ids))
+            new_ids = np.zeros(cap, dtype=np.int64)
+            new_codes = np.zeros((cap, self.codes.shape[1]), dtype=np.uint8)
+            new_ids[:self.size] = self.ids[:self.size]
+            new_codes[:self.size] = self.codes[:self.size]
+            self.ids, self.codes = new_ids, new_codes
+        self.ids[self.size:need] = ids
+        self.codes[self.size:need] = codes
+        self.size = need
+
+    def remove_at(self, pos: int) -> int | None:
+        """Swap-removes the entry at pos; returns the id that moved into pos, if any."""
+        last = self.size - 1
+        moved = None
+        if pos != last:
+            self.ids[pos] = self.ids[last]
+            self.codes[pos] = self.codes[last]
+            moved = int(self.ids[pos])
+        self.size = last
+        return moved
+
+
+class IVFPQIndex:
+    """In-process IVF-PQ index over float32 embeddings with integer ids.
+
+    nlist coarse k-means cells, each holding residuals product-quantized into m
+    one-byte codes. Queries scan the nprobe closest cells with per-cell lookup
+    tables (asymmetric distance). Recall/latency knobs: nlist, m, nprobe.
+    """
+
+    def __init__(self, dim: int, nlist: int, m: int = 16, nprobe: int = 16):
+        if dim % m:
+            raise ValueError(f"dim {dim} is not divisible by m={m}")
+        self.dim = dim
+        self.nlist = nlist
+        self.m = m
+        self.dsub = dim // m
+        self.nprobe = nprobe
+        self.centroids = None
+        self.codebooks = None
+        self._codebooks_t = None
+        self._codebook_sq = None
+        self.lists: list[_InvertedList] = []
+        self._where: dict[int, tuple[int, int]] = {}
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def train(self, x: np.ndarray, seed: int = 0):
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        self.centroids = kmeans(x, self.nlist, seed=seed)
+        self.nlist = len(self.centroids)
+        sample = x[np.random.default_rng(seed).choice(len(x), min(len(x), KMEANS_SAMPLE), replace=False)]
+        residuals = sample - self.centroids[_assign(sample, self.centroids)]
+        self.codebooks = np.stack([
+            kmeans(np.ascontiguousarray(residuals[:, j * self.dsub:(j + 1) * self.dsub]), 256, seed=seed + j)
+            for j in range(self.m)
+        ])
+        self._codebooks_t = np.ascontiguousarray(self.codebooks.transpose(0, 2, 1))
+        self._codebook_sq = np.einsum("mkd,mkd->mk", self.codebooks, self.codebooks)
+        self.lists = [_InvertedList(self.m) for _ in range(self.nlist)]
+        self._where = {}
+
+    def _encode(self, residuals: np.ndarray) -> np.ndarray:
+        codes = np.empty((len(residuals), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            sub = np.ascontiguousarray(residuals[:, j * self.dsub:(j + 1) * self.dsub])
+            codes[:, j] = _assign(sub, self.codebooks[j])
+        return codes
+
+    def add(self, ids: np.ndarray, x: np.ndarray):
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        x = np.ascontiguousarray(x, dtype=np.float32).reshape(-1, self.dim)
+        self.remove(ids)
+        cells = _assign(x, self.centroids)
+        codes = self._encode(x - self.centroids[cells])
+        order = np.argsort(cells, kind="stable")
+        bounds = np.flatnonzero(np.diff(cells[order])) + 1
+        for group in np.split(order, bounds):
+            if not len(group):
+                continue
+            cell = int(cells[group[0]])
+            lst = self.lists[cell]
+            start = lst.size
+            lst.append(ids[group], codes[group])
+            for offset, item_id in enumerate(ids[group]):
+                self._where[int(item_id)] = (cell, start + offset)
+
+    def remove(self, ids):
+        for item_id in np.asarray(ids, dtype=np.int64).reshape(-1):
+            where = self._where.pop(int(item_id), None)
+            if where is None:
+                continue
+            cell, pos = where
+            moved = self.lists[cell].remove_at(pos)
+            if moved is not None:
+                self._where[moved] = (cell, pos)
+
+    def search(self, q: np.ndarray, k: int, nprobe: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """Returns (ids, approximate squared distances) of up to k nearest entries."""
+        q = np.asarray(q, dtype=np.float32).reshape(-1)
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        coarse = np.sum((self.centroids - q) ** 2, axis=1)
+        probe = np.argpartition(coarse, nprobe - 1)[:nprobe] if nprobe < self.nlist else np.arange(self.nlist)
+
+        probe = [int(c) for c in probe if self.lists[c].size]
+        if not probe:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        # Lookup tables for all probed cells at once: ||r_j - c||^2 = ||r_j||^2 - 2 r_j.c + ||c||^2.
+        r = (q - self.centroids[probe]).reshape(len(probe), self.m, self.dsub).transpose(1, 0, 2)
+        lut = np.matmul(r, self._codebooks_t)                    # [m, nprobe, 256]
+        lut *= -2.0
+        lut += self._codebook_sq[:, None, :]
+        lut += np.sum(r * r, axis=2)[:, :, None]
+
+        sizes = [self.lists[c].size for c in probe]
+        codes = np.concatenate([self.lists[c].codes[:n] for c, n in zip(probe, sizes)])
+        ids = np.concatenate([self.lists[c].ids[:n] for c, n in zip(probe, sizes)])
+        slot = np.repeat(np.arange(len(probe)), sizes)
+        d = lut[np.arange(self.m), slot[:, None], codes].sum(axis=1)
+        k = min(k, len(d))
+        top = np.argpartition(d, k - 1)[:k] if k < len(d) else np.arange(len(d))
+        top = top[np.argsort(d[top], kind="stable")]
+        return ids[top], d[top]
@@ -0,0 +1,110 @@
+import asyncio
+import time
+
+import torch
+
+
+class BatchStats:
+    def __init__(self, max_batch_size: int):
+        self.max_batch_size = max_batch_size
+        self.batches = 0
+        self.items = 0
+        self.failed_batches = 0
+        self.size_hist = [0] * (max_batch_size + 1)
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+
+    def record(self, size: int, waits_ms: list[float]):
+        self.batches += 1
+        self.items += size
+        self.size_hist[size] += 1
+        self.wait_total_ms += sum(waits_ms)
+        self.wait_max_ms = max(self.wait_max_ms, max(waits_ms))
+
+    def snapshot(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "failed_batches": self.failed_batches,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "batch_size_hist": {size: n for size, n in enumerate(self.size_hist) if n},
+            "avg_queue_wait_ms": self.wait_total_ms / self.items if self.items else 0.0,
+            "max_queue_wait_ms": self.wait_max_ms,
+        }
+
+
+class EmbeddingBatcher:
+    """Collects concurrent single-image requests into one [N, 3, H, W] forward pass.
+
+    `runner` is an async callable taking the stacked batch and returning an
+    [N, EMBED_DIM] float32 array; it decides where the forward actually runs.
+    """
+
+    def __init__(self, runner, max_batch_size: int, max_wait_ms: float):
+        self.runner = runner
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.stats = BatchStats(self.max_batch_size)
+        self._loop = None
+        self._queue = None
+        self._worker = None
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def submit(self, x: torch.Tensor):
+        self._ensure_worker()
+        fut = self._loop.create_future()
+        self._queue.put_nowait((x, fut, time.perf_counter()))
+        return await fut
+
+    async def _collect(self) -> list:
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            self.stats.record(len(batch), [(started - queued) * 1000 for _, _, queued in batch])
+
+            try:
+                out = await self.runner(self._stack([item for item, _, _ in batch]))
+            except Exception as exc:
+                self.stats.failed_batches += 1
+                for _, fut, _ in batch:
+                    if not fut.done():
+                        fut.set_exception(exc)
+                continue
+
+            for i, (_, fut, _) in enumerate(batch):
+                if not fut.done():
+                    fut.set_result(out[i].copy())
+
+    @staticmethod
+    def _stack(items: list) -> torch.Tensor:
+        first = items[0]
+        x = torch.empty((len(items), *first.shape), dtype=first.dtype, memory_format=torch.channels_last)
+        for i, item in enumerate(items):
+            x[i].copy_(item)
+        return x
@@ -0,0 +1,101 @@
+"""Binary format of face_embeddings.embedding.
+
+Rows written before the format existed are raw little-endian float32 with no
+header (4 * dim bytes) and are still read. Current rows are a 16-byte header
+followed by dim values of the header's dtype:
+
+    magic   3s   b"EMB"
+    version u1   VERSION
+    dtype   u1   0 float32, 1 float16, 2 int8 (symmetric, value = q * scale)
+    -       u1
+    dim     u2
+    model   u4   model_id() of the model version that produced the embedding
+    scale   f4   int8 only, 0 otherwise
+"""
+import hashlib
+
+import numpy as np
+
+MAGIC = b"EMB"
+VERSION = 1
+FORMATS = {"float32": 0, "float16": 1, "int8": 2}
+PAYLOAD = {0: np.dtype("<f4"), 1: np.dtype("<f2"), 2: np.dtype("i1")}
+_ITEMSIZE = np.array([PAYLOAD[code].itemsize for code in range(len(PAYLOAD))], dtype=np.int64)
+LEGACY = None
+
+HEADER = np.dtype([
+    ("magic", "S3"), ("version", "u1"), ("dtype", "u1"), ("pad", "u1"),
+    ("dim", "<u2"), ("model", "<u4"), ("scale", "<f4"),
+])
+
+
+def model_id(version: str) -> int:
+    return int.from_bytes(hashlib.blake2b(version.encode(), digest_size=4).digest(), "little")
+
+
+def embedding_model(data: bytes) -> int:
+    """model_id stamped into an encoded row; 0 for headerless rows, which carry none."""
+    if len(data) >= HEADER.itemsize:
+        head = np.frombuffer(data, dtype=HEADER, count=1)
+        if valid_headers(head, len(data))[0]:
+            return int(head["model"][0])
+    return 0
+
+
+def same_model(model, current: int):
+    """Whether rows stamped with `model` (an int or an array of them) are comparable with embeddings
+    of the `current` model id. Unstamped rows (0) are accepted, they predate the stamp."""
+    return (model == 0) | (model == current)
+
+
+def encoded_size(dim: int, code: int | None) -> int:
+    """Byte length of an embedding of `dim` values stored as `code` (LEGACY: headerless float32)."""
+    if code is LEGACY:
+        return 4 * dim
+    return HEADER.itemsize + dim * PAYLOAD[code].itemsize
+
+
+def encode_embedding(emb: np.ndarray, code: int = 0, model: int = 0) -> bytes:
+    emb = np.asarray(emb, dtype=np.float32).reshape(-1)
+    head = np.zeros((), dtype=HEADER)
+    head["magic"], head["version"], head["dtype"], head["dim"], head["model"] = MAGIC, VERSION, code, emb.size, model
+    if code == 2:
+        peak = float(np.abs(emb).max()) if emb.size else 0.0
+        scale = peak / 127 if peak > 0 else 1.0
+        head["scale"] = scale
+        payload = np.clip(np.rint(emb / scale), -127, 127).astype(np.int8)
+    else:
+        payload = emb.astype(PAYLOAD[code])
+    return head.tobytes() + payload.tobytes()
+
+
+def valid_headers(head: np.ndarray, size: int, code: int | None = None) -> np.ndarray:
+    """Mask of headers that describe a `size`-byte row (of dtype `code`, if given)."""
+    known = head["dtype"] < len(_ITEMSIZE)
+    item = _ITEMSIZE[np.where(known, head["dtype"], 0)]
+    ok = (head["magic"] == MAGIC) & (head["version"] == VERSION) & known
+    ok &= HEADER.itemsize + head["dim"].astype(np.int64) * item == size
+    if code is not None:
+        ok &= head["dtype"] == code
+    return ok
+
+
+def decode_embedding(data: bytes) -> np.ndarray:
+    """float32 vector from either format."""
+    if len(data) >= HEADER.itemsize:
+        head = np.frombuffer(data, dtype=HEADER, count=1)
+        if valid_headers(head, len(data))[0]:
+            code = int(head["dtype"][0])
+            payload = np.frombuffer(data, dtype=PAYLOAD[code], offset=HEADER.itemsize)
+            if code == 2:
+                return payload.astype(np.float32) * head["scale"][0]
+            return payload.astype(np.float32, copy=False)
+    return np.frombuffer(data, dtype=np.float32)
+
+
+def decode_payloads(head: np.ndarray | None, payload: np.ndarray, code: int | None, out: np.ndarray):
+    """Writes float32 rows of fixed-size `payload` [n, dim] into `out` [n, dim]."""
+    if code == 2:
+        np.multiply(payload, head["scale"][:, None], out=out)
+    else:
+        out[...] = payload
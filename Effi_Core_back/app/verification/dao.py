@@ -1,123 +1,479 @@
-from typing import Optional
+import logging
+from typing import NamedTuple, Optional
 
 import numpy as np
 from app.abstract_objects.abc_dao import BaseDAO
+from app.user.models import Users
 from app.verification.models import FaceEmbedding, FacePin
 from app.user.auth import JwtController
-from app.database import async_session
+from app.config import settings
+from app.database import engine
+from sqlalchemy import Integer, LargeBinary, String, column, func, insert, literal, text, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql import select, delete
+from .face_cache import face_cache
+from .codec import FORMATS, HEADER, LEGACY, PAYLOAD, decode_embedding, decode_payloads, embedding_model, encode_embedding, \
+    encoded_size, model_id, same_model, valid_headers
+from .model_version import get_model_version
+from .vector import Vector
+
+logger = logging.getLogger(__name__)
+
+PGVECTOR = settings.EMBEDDING_STORE == "pgvector"
+EMBEDDING_FORMAT = FORMATS[settings.EMBEDDING_CODEC]
+MODEL_ID = model_id(get_model_version())
+
+PGCOPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+
+
+class VerifyData(NamedTuple):
+    id: int
+    email_confirmed: bool
+    is_active: bool
+    emb_id: int | None
+    templates: list[bytes] | None
+    has_pin: bool
+
+
+def current_templates(templates: list[bytes]) -> list[bytes]:
+    """Drops stored templates stamped by another model version: distances between embeddings of
+    different models mean nothing."""
+    kept = [t for t in templates if same_model(embedding_model(t), MODEL_ID)]
+    if len(kept) < len(templates):
+        logger.warning("skipped %d template(s) of another model version", len(templates) - len(kept))
+    return kept
+
+
+class EmbeddingCopySink:
+    """Decodes binary COPY streams of (user_id int4, slot int2, embedding bytea) rows straight into
+    preallocated arrays. Each stream carries one stored format, so every row has the same
+    size and whole chunks are parsed with one structured-dtype frombuffer instead of
+    per-row Python objects. Streams are appended one after another (`expect`). With `model`, rows
+    stamped by another model version are skipped and counted in `stale`."""
+
+    def __init__(self, user_ids: np.ndarray, slots: np.ndarray, matrix: np.ndarray, model: int = 0):
+        self.user_ids = user_ids
+        self.slots = slots
+        self.matrix = matrix
+        self.model = model
+        self.rows = 0
+        self.skipped = 0
+        self.stale = 0
+
+    def expect(self, code: int | None, n: int):
+        dim = self.matrix.shape[1]
+        fields = [
+            ("fields", ">i2"), ("id_len", ">i4"), ("user_id", ">i4"),
+            ("slot_len", ">i4"), ("slot", ">i2"), ("emb_len", ">i4"),
+        ]
+        if code is LEGACY:
+            fields.append(("emb", "<f4", (dim,)))
+        else:
+            fields += [("head", HEADER), ("emb", PAYLOAD[code], (dim,))]
+        self._dtype = np.dtype(fields)
+        self._code = code
+        self._size = encoded_size(dim, code)
+        self._left = n
+        self._buf = bytearray()
+        self._header = True
+
+    def _valid(self, recs: np.ndarray) -> np.ndarray:
+        if self._code is not LEGACY:
+            valid = valid_headers(recs["head"], self._size, self._code)
+            if self.model:
+                current = same_model(recs["head"]["model"], self.model)
+                self.stale += int((valid & ~current).sum())
+                valid &= current
+            return valid
+        # A headerless row can only be mistaken for an encoded row of another dim.
+        head = np.ascontiguousarray(recs["emb"][:, :HEADER.itemsize // 4]).view(HEADER).reshape(-1)
+        return ~valid_headers(head, self._size)
+
+    async def __call__(self, chunk: bytes):
+        self._buf += chunk
+        if self._header:
+            if len(self._buf) < 19:
+                return
+            if self._buf[:11] != PGCOPY_SIGNATURE:
+                raise ValueError("not a binary COPY stream")
+            ext_len = int.from_bytes(self._buf[15:19], "big")
+            if len(self._buf) < 19 + ext_len:
+                return
+            del self._buf[:19 + ext_len]
+            self._header = False
+        n = min(len(self._buf) // self._dtype.itemsize, self._left)
+        if n <= 0:
+            return
+        recs = np.frombuffer(self._buf, dtype=self._dtype, count=n)
+        if (recs["emb_len"] != self._size).any():
+            raise ValueError("unexpected embedding size in COPY stream")
+        valid = self._valid(recs)
+        if not valid.all():
+            self.skipped += int(n - valid.sum())
+            recs = recs[valid]
+        k = len(recs)
+        self.user_ids[self.rows:self.rows + k] = recs["user_id"]
+        self.slots[self.rows:self.rows + k] = recs["slot"]
+        decode_payloads(recs["head"] if self._code is not LEGACY else None, recs["emb"], self._code,
+                        self.matrix[self.rows:self.rows + k])
+        self.rows += k
+        self._left -= n
+        del recs
+        del self._buf[:n * self._dtype.itemsize]
 
 
 class FaceDao(BaseDAO):
     model = FaceEmbedding
 
     @classmethod
-    async def add_one(cls, user_id: int, emb: np.ndarray, meta: str = None):
-        emb_bytes = emb.astype(np.float32).tobytes()
-        async with async_session() as session:
-            obj = cls.model(user_id=user_id, embedding=emb_bytes, meta=meta)
-            session.add(obj)
-            await session.commit()
-            await session.refresh(obj)
-            return obj
+    def _emb_values(cls, emb: np.ndarray) -> dict:
+        emb = emb.astype(np.float32)
+        values = {"embedding": encode_embedding(emb, EMBEDDING_FORMAT, MODEL_ID)}
+        if PGVECTOR:
+            values["embedding_vec"] = emb
+        return values
 
     @classmethod
-    async def get_by_id(cls, user_id: int):
-        async with async_session() as session:
-            q = await session.execute(select(cls.model).where(FaceEmbedding.user_id == user_id))
-            row = q.scalars().one_or_none()
-            if row is None:
-                return None
-            emb = np.frombuffer(row.embedding, dtype=np.float32)
-            return (row.id, row.user_id, emb)
+    async def add_one(cls, user_id: int, emb: np.ndarray, meta: str = None, session: AsyncSession | None = None):
+        """Row (id, user_id, created_at) of the new embedding."""
+        stmt = (
+            insert(cls.model)
+            .values(user_id=user_id, meta=meta, **cls._emb_values(emb))
+            .returning(cls.model.id, cls.model.user_id, cls.model.created_at)
+        )
+        async with cls.use_session(session) as session:
+            q = await session.execute(stmt)
+            row = q.one()
+            await cls.commit(session)
+            await cls.after_commit(session, lambda: face_cache.invalidate([user_id], pin=False))
+            return row
 
+    @classmethod
+    def _primary(cls):
+        return (
+            select(cls.model.id, cls.model.user_id, cls.model.embedding)
+            .where(cls.model.slot == 0)
+        )
+
+    @classmethod
+    async def get_by_id(cls, user_id: int, session: AsyncSession | None = None):
+        """(id, user_id, embedding) of the user's primary template: slot 0, which the PIN belongs to.
+        Read through face_cache."""
+        key = face_cache.emb_key(user_id)
+        (cached,), generation = await face_cache.get_many(user_id, [key])
+        if cached is not None:
+            return face_cache.unpack_emb(cached)
+        async with cls.use_session(session) as session:
+            q = await session.execute(cls._primary().where(cls.model.user_id == user_id))
+            row = q.one_or_none()
+        await face_cache.set_many(user_id, generation, {key: face_cache.pack_emb(row)})
+        if row is None:
+            return None
+        return (row.id, row.user_id, decode_embedding(row.embedding))
 
     @classmethod
-    async def get_all_embeddings(cls, limit: int = None):
-        async with async_session() as session:
-            q = await session.execute(select(cls.model))
+    async def get_with_pin(cls, user_id: int, with_hash: bool = False,
+                           session: AsyncSession | None = None) -> tuple[tuple | None, FacePin | None]:
+        """(get_by_id row, PIN of that template) with both cache keys fetched in one round trip
+        and one joined query on a miss. The PIN is a detached FacePin; its hashed_pin is only
+        set with `with_hash`, which always reads the database since hashes are not cached."""
+        emb_key, pin_key = face_cache.emb_key(user_id), face_cache.pin_key(user_id)
+        (cached_emb, cached_pin), generation = await face_cache.get_many(user_id, [emb_key, pin_key])
+        if cached_emb is not None and cached_pin is not None and not with_hash:
+            row, pin = face_cache.unpack_emb(cached_emb), face_cache.unpack_pin(cached_pin)
+            # The keys are written and deleted separately; a PIN of another template is a miss.
+            if pin is None or (row is not None and pin[1] == row[0]):
+                return row, None if pin is None else FacePin(id=pin[0], emb_id=pin[1])
+        primary = cls._primary().where(cls.model.user_id == user_id).subquery()
+        query = select(primary, FacePin.id.label("pin_id"), FacePin.hashed_pin).outerjoin(
+            FacePin, FacePin.emb_id == primary.c.id
+        )
+        async with cls.use_session(session) as session:
+            q = await session.execute(query)
+            row = q.one_or_none()
+        pin = None
+        if row is not None and row.pin_id is not None:
+            pin = FacePin(id=row.pin_id, emb_id=row.id, hashed_pin=row.hashed_pin)
+        await face_cache.set_many(user_id, generation, {emb_key: face_cache.pack_emb(row), pin_key: face_cache.pack_pin(pin)})
+        if row is None:
+            return None, None
+        return (row.id, row.user_id, decode_embedding(row.embedding)), pin
+
+
+    @classmethod
+    async def get_all_embeddings(cls, limit: int = None, session: AsyncSession | None = None):
+        async with cls.use_session(session) as session:
+            q = await session.execute(select(cls.model).order_by(cls.model.id).limit(limit))
             rows = q.scalars().all()
-            res = [(r.id, r.user_id, np.frombuffer(r.embedding, dtype=np.float32)) for r in rows]
+            res = [(r.id, r.user_id, decode_embedding(r.embedding)) for r in rows]
             return res
 
     @classmethod
-    async def get_by_filter_or_none(cls, **filter_by):
-        async with async_session() as session:
+    async def load_embeddings(cls, dim: int, limit: int = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(user_ids [N] int64, slots [N] int16, matrix [N, dim] float32) of all templates of size `dim`,
+        streamed with binary COPY into arrays sized up front; rows of other sizes or of another model
+        version are skipped.
+        Every stored format has its own byte length, so there is one COPY per format present;
+        rows are ordered by id within a format."""
+        sizes = {encoded_size(dim, code): code for code in (LEGACY, *PAYLOAD)}
+        where = "user_id IS NOT NULL AND length(embedding) = $1"
+        async with engine.connect() as conn:
+            raw = (await conn.get_raw_connection()).driver_connection
+            # counts and COPY see the same snapshot, so the arrays are sized exactly.
+            async with raw.transaction(isolation="repeatable_read", readonly=True):
+                counts = dict(await raw.fetch(
+                    "SELECT length(embedding), count(*) FROM face_embeddings "
+                    "WHERE user_id IS NOT NULL AND length(embedding) = ANY($1) GROUP BY 1",
+                    list(sizes),
+                ))
+                n = sum(counts.values())
+                if limit is not None:
+                    n = min(n, limit)
+                sink = EmbeddingCopySink(
+                    np.empty(n, dtype=np.int64), np.empty(n, dtype=np.int16), np.empty((n, dim), dtype=np.float32),
+                    MODEL_ID,
+                )
+                left = n
+                for size, code in sizes.items():
+                    count = min(counts.get(size, 0), left)
+                    if not count:
+                        continue
+                    sink.expect(code, count)
+                    await raw.copy_from_query(
+                        f"SELECT user_id, slot, embedding FROM face_embeddings WHERE {where} ORDER BY id LIMIT $2",
+                        size, count, output=sink, format="binary",
+                    )
+                    left -= count
+        if sink.stale:
+            logger.warning("skipped %d embedding(s) of another model version", sink.stale)
+        return sink.user_ids[:sink.rows], sink.slots[:sink.rows], sink.matrix[:sink.rows]
+
+    @classmethod
+    async def bulk_upsert(cls, items: list[tuple[int, np.ndarray]], session: AsyncSession | None = None) -> dict[int, int]:
+        """One INSERT ... SELECT ... ON CONFLICT (user_id, slot) DO UPDATE for the whole chunk,
+        writing template slot 0. Rows are joined against users, so unknown user ids are skipped
+        instead of failing the statement. Returns {user_id: embedding id} for the rows written."""
+        if not items:
+            return {}
+        cols = [column("user_id", Integer), column("embedding", LargeBinary)]
+        if PGVECTOR:
+            cols.append(column("embedding_vec", Vector(settings.EMBED_DIM)))
+        rows = [tuple(cls._emb_values(emb).values()) for _, emb in items]
+        src = values(*cols, name="src").data([(user_id, *row) for (user_id, _), row in zip(items, rows)])
+        names = [c.name for c in cols]
+        stmt = pg_insert(cls.model).from_select(
+            names, select(*src.c).join(Users, Users.id == src.c.user_id)
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.model.user_id, cls.model.slot],
+            set_={name: stmt.excluded[name] for name in names[1:]},
+        ).returning(cls.model.user_id, cls.model.id)
+        async with cls.use_session(session) as session:
+            q = await session.execute(stmt)
+            written = dict(q.all())
+            await cls.commit(session)
+            await cls.after_commit(session, lambda: face_cache.invalidate(written, pin=False))
+            return written
+
+    @classmethod
+    async def get_verify_data(cls, email: str, session: AsyncSession | None = None) -> VerifyData | None:
+        """Everything /face/verify needs: user flags, all stored templates in slot order, PIN
+        presence. Templates and the PIN reference are read through face_cache, so a hit costs
+        one indexed user lookup. emb_id is the primary (slot 0) template; emb_id/templates are
+        None when the user has no embedding. Templates are not read for a user who cannot log in."""
+        async with cls.use_session(session) as session:
+            q = await session.execute(
+                select(Users.id, Users.email_confirmed, Users.is_active).where(Users.email == email)
+            )
+            user = q.one_or_none()
+            if user is None:
+                return None
+            if not (user.is_active and user.email_confirmed):
+                return VerifyData(*user, None, None, False)
+
+            tpl_key, pin_key = face_cache.tpl_key(user.id), face_cache.pin_key(user.id)
+            (cached_tpl, cached_pin), generation = await face_cache.get_many(user.id, [tpl_key, pin_key])
+            if cached_tpl is not None and cached_pin is not None:
+                emb_id, templates = face_cache.unpack_templates(cached_tpl)
+                pin = face_cache.unpack_pin(cached_pin)
+                # The keys are written and deleted separately; a PIN of another template is a miss.
+                if pin is None or pin[1] == emb_id:
+                    return VerifyData(*user, emb_id, current_templates(templates) if templates else None, pin is not None)
+
+            q = await session.execute(
+                select(cls.model.id, cls.model.slot, cls.model.embedding, FacePin.id.label("pin_id"))
+                .outerjoin(FacePin, FacePin.emb_id == cls.model.id)
+                .where(cls.model.user_id == user.id)
+                .order_by(cls.model.slot)
+            )
+            rows = q.all()
+        emb_id = next((r.id for r in rows if r.slot == 0), None)
+        pins = [FacePin(id=r.pin_id, emb_id=r.id) for r in rows if r.pin_id is not None]
+        pin = next((p for p in pins if p.emb_id == emb_id), None)
+        templates = [r.embedding for r in rows]
+        items = {tpl_key: face_cache.pack_templates(emb_id, templates)}
+        # pinref only describes the primary template's PIN; a PIN elsewhere is never cached as absent.
+        if pin is not None or not pins:
+            items[pin_key] = face_cache.pack_pin(pin)
+        await face_cache.set_many(user.id, generation, items)
+        return VerifyData(*user, emb_id, current_templates(templates) if templates else None, bool(pins))
+
+    @classmethod
+    async def nearest(cls, emb: np.ndarray, k: int, session: AsyncSession | None = None) -> list[tuple[int, float]]:
+        """Top-k (user_id, L2 distance to the user's nearest template) through the pgvector index.
+        The index returns templates; k * MAX_TEMPLATES of them always cover k distinct users."""
+        dist = cls.model.embedding_vec.l2_distance(emb)
+        n = k * max(1, settings.MAX_TEMPLATES)
+        param = "hnsw.ef_search" if settings.PGVECTOR_INDEX == "hnsw" else "ivfflat.probes"
+        # hnsw returns at most ef_search rows, so it has to cover the candidates.
+        search = max(settings.PGVECTOR_SEARCH, n) if param == "hnsw.ef_search" else settings.PGVECTOR_SEARCH
+        cand = select(cls.model.user_id, dist.label("dist")).order_by(dist).limit(n).subquery()
+        best = func.min(cand.c.dist)
+        query = select(cand.c.user_id, best).where(cand.c.dist.is_not(None)).group_by(cand.c.user_id).order_by(best).limit(k)
+        async with cls.use_session(session) as session:
+            # SET LOCAL lasts until the end of the current transaction.
+            await session.execute(text(f"SET LOCAL {param} = {int(search)}"))
+            q = await session.execute(query)
+            return [(user_id, float(d)) for user_id, d in q.all()]
+
+    @classmethod
+    async def get_by_filter_or_none(cls, session: AsyncSession | None = None, **filter_by):
+        async with cls.use_session(session) as session:
             query = select(cls.model).filter_by(**filter_by)
             result = await session.execute(query)
             return result.scalar_one_or_none()
 
 
     @classmethod
-    async def delete(cls, user_id: int) -> bool:
-        async with async_session() as session:
-            q = await session.execute(select(cls.model).where(cls.model.user_id==user_id))
-            obj = q.scalars().one_or_none()
-            if not obj:
-                return False
-            await session.delete(obj)
-            await session.commit()
-            return True
+    async def delete(cls, user_id: int, session: AsyncSession | None = None) -> bool:
+        """Deletes all of the user's templates and the PIN in one statement. The PIN delete is
+        a CTE: the foreign key is checked at the end of the statement, after both deletes."""
+        pins = (
+            delete(FacePin)
+            .where(FacePin.emb_id.in_(select(cls.model.id).where(cls.model.user_id == user_id)))
+            .cte("pins")
+        )
+        stmt = delete(cls.model).where(cls.model.user_id == user_id).add_cte(pins).returning(cls.model.id)
+        async with cls.use_session(session) as session:
+            q = await session.execute(stmt)
+            deleted = q.scalars().all()
+            await cls.commit(session)
+            if deleted:
+                await cls.after_commit(session, lambda: face_cache.invalidate([user_id]))
+            return bool(deleted)
 
     @classmethod
-    async def create_or_update(cls, user_id: int, emb: np.ndarray, meta: str | None = None):
-        emb_bytes = emb.astype(np.float32).tobytes()
-        async with async_session() as session:
-            q = await session.execute(select(cls.model).where(cls.model.user_id == user_id))
-            obj = q.scalars().one_or_none()
-            if obj:
-                obj.embedding = emb_bytes
-                if meta is not None:
-                    obj.meta = meta
-            else:
-                obj = cls.model(user_id=user_id, embedding=emb_bytes, meta=meta)
-            session.add(obj)
-            await session.commit()
-            await session.refresh(obj)
-            return obj.id, obj
+    async def create_or_update(cls, user_id: int, emb: np.ndarray, meta: str | None = None, slot: int = 0,
+                               session: AsyncSession | None = None):
+        """INSERT ... ON CONFLICT (user_id, slot) DO UPDATE; an existing meta is kept when `meta` is None.
+        Returns (embedding id, row (id, user_id, created_at))."""
+        values = cls._emb_values(emb)
+        stmt = pg_insert(cls.model).values(user_id=user_id, slot=slot, meta=meta, **values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.model.user_id, cls.model.slot],
+            set_={**{name: stmt.excluded[name] for name in values}, "meta": func.coalesce(stmt.excluded.meta, cls.model.meta)},
+        ).returning(cls.model.id, cls.model.user_id, cls.model.created_at)
+        async with cls.use_session(session) as session:
+            q = await session.execute(stmt)
+            row = q.one()
+            await cls.commit(session)
+            await cls.after_commit(session, lambda: face_cache.invalidate([user_id], pin=False))
+            return row.id, row
 
+    @classmethod
+    async def add_template(cls, user_id: int, emb: np.ndarray, meta: str | None = None,
+                           max_templates: int = settings.MAX_TEMPLATES, session: AsyncSession | None = None):
+        """Stores the template in the user's lowest free slot, picked and written by one statement.
+        Returns (embedding id, slot), None when all max_templates slots are taken.
+
+        A concurrent write can take the chosen slot first; ON CONFLICT then waits for it to commit
+        and the statement, rerun with a new snapshot, picks the next free slot."""
+        free = func.generate_series(0, max_templates - 1).column_valued("slot")
+        taken = select(cls.model.slot).where(cls.model.user_id == user_id)
+        values = cls._emb_values(emb)
+        cols = {"embedding": LargeBinary(), "embedding_vec": Vector(settings.EMBED_DIM)}
+        src = (
+            select(literal(user_id, Integer()), free, literal(meta, String()), *(literal(v, cols[k]) for k, v in values.items()))
+            .where(free.not_in(taken))
+            .order_by(free)
+            .limit(1)
+        )
+        stmt = (
+            pg_insert(cls.model)
+            .from_select(["user_id", "slot", "meta", *values], src)
+            .on_conflict_do_nothing(index_elements=[cls.model.user_id, cls.model.slot])
+            .returning(cls.model.id, cls.model.slot)
+        )
+        count = select(func.count()).select_from(cls.model).where(cls.model.user_id == user_id)
+        async with cls.use_session(session) as session:
+            # Every lost race fills a slot, so max_templates attempts always end with a row or a full user.
+            for _ in range(max_templates):
+                row = (await session.execute(stmt)).one_or_none()
+                if row is not None or await session.scalar(count) >= max_templates:
+                    break
+            await cls.commit(session)
+            if row is not None:
+                await cls.after_commit(session, lambda: face_cache.invalidate([user_id], pin=False))
+            return None if row is None else (row.id, row.slot)
 
 
 
-class FacePinDao:
+
+class FacePinDao(BaseDAO):
     model = FacePin
 
     @classmethod
-    async def add_one(cls, emb_id: int, pin: str) -> FacePin:
-        hashed = JwtController.get_password_hash(password=pin)
-        async with async_session() as session:
-            try:
-                obj = cls.model(emb_id=emb_id, hashed_pin=hashed)
-                session.add(obj)
-                await session.commit()
-                await session.refresh(obj)
-                return obj
-            except Exception as e:
+    async def add_one(cls, emb_id: int, pin: str, session: AsyncSession | None = None):
+        """Row (id, emb_id, user_id) of the new PIN, False if the embedding already has one."""
+        hashed = await JwtController.get_password_hash_async(password=pin)
+        ins = (
+            pg_insert(cls.model)
+            .values(emb_id=emb_id, hashed_pin=hashed)
+            .on_conflict_do_nothing(index_elements=[cls.model.emb_id])
+            .returning(cls.model.id, cls.model.emb_id)
+            .cte("ins")
+        )
+        stmt = select(ins.c.id, ins.c.emb_id, FaceEmbedding.user_id).join(FaceEmbedding, FaceEmbedding.id == ins.c.emb_id)
+        async with cls.use_session(session) as session:
+            q = await session.execute(stmt)
+            row = q.one_or_none()
+            if row is None:
                 return False
+            await cls.commit(session)
+            await cls.after_commit(session, lambda: face_cache.invalidate([row.user_id], emb=False))
+            return row
 
     @classmethod
-    async def get_by_id(cls, pin_id: int) -> Optional[FacePin]:
-        async with async_session() as session:
+    async def get_by_id(cls, pin_id: int, session: AsyncSession | None = None) -> Optional[FacePin]:
+        async with cls.use_session(session) as session:
             q = await session.execute(select(cls.model).where(cls.model.id == pin_id))
             return q.scalars().one_or_none()
 
     @classmethod
-    async def get_by_emb_id(cls, emb_id: int) -> Optional[FacePin]:
-        async with async_session() as session:
+    async def get_by_emb_id(cls, emb_id: int, session: AsyncSession | None = None) -> Optional[FacePin]:
+        async with cls.use_session(session) as session:
             q = await session.execute(select(cls.model).where(cls.model.emb_id == emb_id))
             return q.scalars().one_or_none()
 
 
 
     @classmethod
-    async def delete_by_id(cls, pin_id: int) -> bool:
-        async with async_session() as session:
-            stmt = delete(cls.model).where(cls.model.id == pin_id)
+    async def delete_by_id(cls, pin_id: int, session: AsyncSession | None = None) -> bool:
+        stmt = (
+            delete(cls.model)
+            .where(cls.model.id == pin_id, FaceEmbedding.id == cls.model.emb_id)
+            .returning(FaceEmbedding.user_id)
+        )
+        async with cls.use_session(session) as session:
             result = await session.execute(stmt)
-            await session.commit()
-            return True
+            user_id = result.scalar_one_or_none()
+            await cls.commit(session)
+            if user_id is not None:
+                await cls.after_commit(session, lambda: face_cache.invalidate([user_id], emb=False))
+            return user_id is not None
 
 
     @classmethod
-    def verify_pin(cls, hashed_pin: str, plain_pin: str) -> bool:
-        return JwtController.verify_password(plain_password=plain_pin, hashed_password=hashed_pin)
+    async def verify_pin(cls, hashed_pin: str, plain_pin: str) -> bool:
+        return await JwtController.verify_password_async(plain_password=plain_pin, hashed_password=hashed_pin)
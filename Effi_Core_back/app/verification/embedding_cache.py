@@ -0,0 +1,124 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from app.config import settings
+from .model_version import get_model_version
+
+# Rough per-entry bookkeeping cost (key, tuple, OrderedDict node) on top of the array data.
+ENTRY_OVERHEAD = 200
+
+
+class EmbeddingCache:
+    """LRU + TTL cache of embeddings keyed by a hash of the uploaded bytes and the model version.
+
+    Identical uploads that arrive while the first one is still being embedded
+    wait on the same task instead of running their own forward pass.
+    """
+
+    def __init__(self, max_bytes: int, ttl_s: float, model_version: str):
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self._salt = model_version.encode()
+        self._entries: OrderedDict[bytes, tuple[float, np.ndarray]] = OrderedDict()
+        self._inflight: dict[bytes, asyncio.Task] = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expired = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 and self.ttl_s > 0
+
+    def key(self, content) -> bytes:
+        h = hashlib.blake2b(self._salt, digest_size=20)
+        h.update(content)
+        return h.digest()
+
+    def get(self, key: bytes) -> np.ndarray | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, emb = entry
+        if expires_at <= time.monotonic():
+            self._drop(key)
+            self.expired += 1
+            return None
+        self._entries.move_to_end(key)
+        return emb
+
+    def put(self, key: bytes, emb: np.ndarray):
+        emb = np.array(emb, dtype=np.float32, copy=True)
+        emb.setflags(write=False)
+        size = emb.nbytes + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (time.monotonic() + self.ttl_s, emb)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def _drop(self, key: bytes):
+        _, emb = self._entries.pop(key)
+        self.bytes -= emb.nbytes + ENTRY_OVERHEAD
+
+    async def get_or_compute(self, content, compute) -> np.ndarray:
+        """`compute` is a zero-argument coroutine function producing the embedding for `content`."""
+        if not self.enabled:
+            return await compute()
+
+        key = self.key(content)
+        emb = self.get(key)
+        if emb is not None:
+            self.hits += 1
+            return emb
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            # A separate task, so one caller disconnecting does not cancel the
+            # forward pass the coalesced callers are waiting on.
+            task = asyncio.ensure_future(compute())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: bytes, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        self.put(key, task.result())
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expired": self.expired,
+            "inflight": len(self._inflight),
+            "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
+
+
+embedding_cache = EmbeddingCache(
+    max_bytes=int(settings.EMBEDDING_CACHE_MB * 1024 * 1024),
+    ttl_s=settings.EMBEDDING_CACHE_TTL_S,
+    model_version=get_model_version(),
+)
@@ -0,0 +1,94 @@
+import json
+
+import numpy as np
+import torch
+
+ENGINES = ("eager", "torchscript", "onnx", "int8")
+
+
+class OnnxEmbeddingNet:
+    """EmbeddingNet exported to ONNX and run by ONNX Runtime on CPU.
+
+    Callable like the torch module: takes an [N,3,H,W] tensor, returns [N,EMBED_DIM].
+    """
+
+    channels_last = False
+
+    def __init__(self, path: str, intra_op_threads: int = 0):
+        try:
+            import onnxruntime as ort
+        except ImportError as exc:
+            raise RuntimeError("MODEL_ENGINE=onnx requires the onnxruntime package") from exc
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if intra_op_threads > 0:
+            opts.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(path, sess_options=opts, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, x: torch.Tensor) -> torch.Tensor:
+        x = np.ascontiguousarray(x.detach().cpu().numpy(), dtype=np.float32)
+        return torch.from_numpy(self.session.run(None, {self.input_name: x})[0])
+
+    def eval(self):
+        return self
+
+
+class QuantizedEmbeddingNet:
+    """Static INT8 EmbeddingNet produced by app.verification.quantize; runs on CPU only."""
+
+    def __init__(self, module: torch.jit.ScriptModule):
+        self.module = module
+
+    def __call__(self, x: torch.Tensor) -> torch.Tensor:
+        return self.module(x.cpu())
+
+    def eval(self):
+        return self
+
+
+def int8_report_path(model_path: str) -> str:
+    return f"{model_path}.json"
+
+
+def load_int8(path: str, backend: str, eer_tolerance: float) -> QuantizedEmbeddingNet:
+    try:
+        with open(int8_report_path(path)) as f:
+            report = json.load(f)
+    except FileNotFoundError:
+        raise RuntimeError(f"{path} has no accuracy report, re-run app.verification.quantize") from None
+    if not report.get("accepted") or report["eer_delta"] > eer_tolerance:
+        raise RuntimeError(
+            f"INT8 model refused: EER delta {report['eer_delta']:.4f} exceeds tolerance {eer_tolerance}"
+        )
+    torch.backends.quantized.engine = backend
+    return QuantizedEmbeddingNet(load_torchscript(path, torch.device("cpu")))
+
+
+def load_torchscript(path: str, device) -> torch.jit.ScriptModule:
+    module = torch.jit.load(path, map_location=device)
+    module.eval()
+    return module
+
+
+def export_torchscript(embedding_net: torch.nn.Module, example: torch.Tensor, path: str):
+    with torch.no_grad():
+        traced = torch.jit.trace(embedding_net, example)
+        traced = torch.jit.freeze(traced)
+    traced.save(path)
+
+
+def export_onnx(embedding_net: torch.nn.Module, example: torch.Tensor, path: str, opset: int = 17):
+    with torch.no_grad():
+        torch.onnx.export(
+            embedding_net,
+            (example,),
+            path,
+            input_names=["input"],
+            output_names=["embedding"],
+            dynamic_axes={"input": {0: "batch"}, "embedding": {0: "batch"}},
+            opset_version=opset,
+            dynamo=False,
+        )
@@ -0,0 +1,140 @@
+import asyncio
+import os
+import time
+import zipfile
+
+import numpy as np
+import torch
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.exceptions import CantSaveEmb, FileTooLarge, InvalidEmb, InvalidImg, NoExistUserException, NoOpenImg
+from .dao import FaceDao
+from .gallery import face_gallery
+from .model_dlm import FAST_PREPROCESS, IMG_SIZE, compute_embeddings_batch_async, eval_transform
+from .preprocess import open_image, preprocess_image
+from .upload import MAX_FILE_SIZE, read_limited
+
+def _item(index: int, user_id: int | None, name: str, read, error: str | None = None) -> dict:
+    # `read` returns the image as a memoryview (see read_limited); it is called from the decode thread, one chunk at a time.
+    return {"index": index, "user_id": user_id, "name": name, "read": read, "error": error}
+
+
+def multipart_items(files: list[UploadFile], user_ids: list[int]) -> list[dict]:
+    items = []
+    for i, (user_id, f) in enumerate(zip(user_ids, files)):
+        error = None if (f.content_type or "").split("/")[0] == "image" else InvalidImg.detail
+        items.append(_item(i, user_id, f.filename, lambda f=f: read_limited(f.file), error))
+    return items
+
+
+def zip_items(archive: UploadFile) -> list[dict]:
+    """Members are named <user_id>.<ext>, directories inside the archive are ignored."""
+    zf = zipfile.ZipFile(archive.file)
+    items = []
+    for info in zf.infolist():
+        base = os.path.basename(info.filename)
+        if info.is_dir() or not base or base.startswith(".") or info.filename.startswith("__MACOSX/"):
+            continue
+        stem = base.split(".", 1)[0]
+        user_id = int(stem) if stem.isdigit() else None
+        error = None
+        if user_id is None:
+            error = "Имя файла должно быть user_id"
+        elif info.file_size > MAX_FILE_SIZE:
+            error = FileTooLarge.detail
+        items.append(_item(len(items), user_id, info.filename, lambda info=info: read_limited(zf.open(info)), error))
+    return items
+
+
+def _decode_chunk(chunk: list[dict]) -> tuple[torch.Tensor, list[dict]]:
+    x = torch.empty((len(chunk), 3, IMG_SIZE, IMG_SIZE), dtype=torch.float32, memory_format=torch.channels_last)
+    decoded = []
+    for item in chunk:
+        if item["error"]:
+            continue
+        try:
+            content = item["read"]()
+        except HTTPException as exc:
+            item["error"] = exc.detail
+            continue
+        except Exception:
+            item["error"] = NoOpenImg.detail
+            continue
+        i = len(decoded)
+        try:
+            if FAST_PREPROCESS:
+                preprocess_image(content, IMG_SIZE, out=x[i:i + 1])
+            else:
+                x[i] = eval_transform(open_image(content).convert("RGB"))
+        except Exception:
+            item["error"] = NoOpenImg.detail
+            continue
+        decoded.append(item)
+    return x[:len(decoded)], decoded
+
+
+async def _write_chunk(decoded: list[dict], embs: np.ndarray):
+    rows = []
+    for item, emb in zip(decoded, embs):
+        if emb.size == 0 or not np.isfinite(emb).all():
+            item["error"] = InvalidEmb.detail
+        else:
+            rows.append((item, emb))
+    try:
+        written = await FaceDao.bulk_upsert([(item["user_id"], emb) for item, emb in rows])
+    except Exception:
+        for item, _ in rows:
+            item["error"] = CantSaveEmb.detail
+        return
+    for item, emb in rows:
+        emb_id = written.get(item["user_id"])
+        if emb_id is None:
+            item["error"] = NoExistUserException.detail
+            continue
+        item["embedding_id"] = emb_id
+        await face_gallery.upsert_async(item["user_id"], emb)
+
+
+async def enroll(model, items: list[dict], batch_size: int = settings.ENROLL_BATCH_SIZE) -> dict:
+    """Decodes chunk k+1 in a worker thread while chunk k runs through the model,
+    then writes each chunk with a single upsert."""
+    started = time.perf_counter()
+    last_index = {item["user_id"]: item["index"] for item in items if not item["error"]}
+    for item in items:
+        if not item["error"] and last_index[item["user_id"]] != item["index"]:
+            item["error"] = "Повторный user_id в пакете"
+
+    batch_size = max(1, batch_size)
+    chunks = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+    pending = asyncio.ensure_future(run_in_threadpool(_decode_chunk, chunks[0])) if chunks else None
+    try:
+        for k in range(len(chunks)):
+            x, decoded = await pending
+            pending = asyncio.ensure_future(run_in_threadpool(_decode_chunk, chunks[k + 1])) if k + 1 < len(chunks) else None
+            if decoded:
+                embs = await compute_embeddings_batch_async(model, x)
+                await _write_chunk(decoded, embs)
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+
+    elapsed = time.perf_counter() - started
+    results = []
+    for item in items:
+        res = {"index": item["index"], "name": item["name"], "user_id": item["user_id"], "ok": not item["error"]}
+        if item["error"]:
+            res["error"] = item["error"]
+        else:
+            res["embedding_id"] = item["embedding_id"]
+        results.append(res)
+    enrolled = sum(r["ok"] for r in results)
+    return {
+        "items": len(items),
+        "enrolled": enrolled,
+        "failed": len(items) - enrolled,
+        "seconds": round(elapsed, 3),
+        "images_per_s": round(enrolled / elapsed, 1) if elapsed > 0 else 0.0,
+        "results": results,
+    }
@@ -0,0 +1,81 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+import torch
+from PIL import Image
+
+from app.config import settings
+from .engines import OnnxEmbeddingNet, export_onnx, export_torchscript, load_torchscript
+from .model_dlm import IMG_SIZE, MODEL_WEIGHTS_PATH, eval_transform, load_model
+
+IMG_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def parity_inputs(images_dir: str | None, n_random: int, seed: int = 0) -> torch.Tensor:
+    gen = torch.Generator().manual_seed(seed)
+    xs = [torch.randn((n_random, 3, IMG_SIZE, IMG_SIZE), generator=gen)]
+    if images_dir:
+        files = sorted(f for f in os.listdir(images_dir) if f.lower().endswith(IMG_EXTENSIONS))
+        for name in files:
+            pil = Image.open(os.path.join(images_dir, name)).convert("RGB")
+            xs.append(eval_transform(pil).unsqueeze(0))
+    return torch.cat(xs)
+
+
+def check_parity(reference: np.ndarray, candidate: np.ndarray) -> dict:
+    diff = np.abs(reference - candidate)
+    cos = np.sum(reference * candidate, axis=1) / (
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1)
+    )
+    return {
+        "max_abs_diff": float(diff.max()),
+        "mean_abs_diff": float(diff.mean()),
+        "max_l2_dist": float(np.linalg.norm(reference - candidate, axis=1).max()),
+        "min_cosine": float(cos.min()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export EmbeddingNet to TorchScript / ONNX and check parity")
+    parser.add_argument("--weights", default=MODEL_WEIGHTS_PATH)
+    parser.add_argument("--formats", nargs="+", choices=("torchscript", "onnx"), default=["torchscript", "onnx"])
+    parser.add_argument("--torchscript-path", default=settings.MODEL_TORCHSCRIPT_PATH)
+    parser.add_argument("--onnx-path", default=settings.MODEL_ONNX_PATH)
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--images", default=None, help="directory with face images to add to the parity set")
+    parser.add_argument("--n-random", type=int, default=8)
+    parser.add_argument("--atol", type=float, default=1e-4, help="max allowed L2 distance to the eager embedding")
+    args = parser.parse_args()
+
+    eager = load_model(args.weights, device=torch.device("cpu"), engine="eager").embedding_net
+    example = torch.randn((1, 3, IMG_SIZE, IMG_SIZE))
+    x = parity_inputs(args.images, args.n_random)
+    with torch.no_grad():
+        reference = eager(x).numpy()
+
+    failed = False
+    for fmt in args.formats:
+        if fmt == "torchscript":
+            path = args.torchscript_path
+            export_torchscript(eager, example, path)
+            with torch.no_grad():
+                candidate = load_torchscript(path, torch.device("cpu"))(x).numpy()
+        else:
+            path = args.onnx_path
+            export_onnx(eager, example, path, opset=args.opset)
+            candidate = OnnxEmbeddingNet(path)(x).numpy()
+
+        report = check_parity(reference, candidate)
+        ok = report["max_l2_dist"] <= args.atol
+        failed |= not ok
+        print(f"{fmt}: {path} ({len(x)} inputs) {'OK' if ok else 'PARITY FAILED'}")
+        for key, value in report.items():
+            print(f"  {key}: {value:.3e}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import struct
+import time
+
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+
+from app.config import settings
+from .codec import decode_embedding
+
+_IDS = struct.Struct("<ii")
+_I4 = struct.Struct("<i")
+# A cached "nothing stored", so users without a face or PIN are not looked up every time.
+ABSENT = b""
+# After a Redis error the cache is bypassed for this long instead of timing out on every request.
+BACKOFF_S = 5.0
+# Lifetime of a user's generation counter after the last write, far longer than any lookup
+# between reading the generation and filling the cache.
+GENERATION_TTL_S = 3600
+
+# Fills KEYS[2..] with ARGV[2..] only if the generation KEYS[1] is still ARGV[1] (read before
+# the database lookup); ARGV[#KEYS + 1] is the TTL in ms.
+FILL_SCRIPT = """
+if (redis.call('GET', KEYS[1]) or '') ~= ARGV[1] then return 0 end
+for i = 2, #KEYS do redis.call('SET', KEYS[i], ARGV[i], 'PX', ARGV[#KEYS + 1]) end
+return 1
+"""
+
+
+class FaceCache:
+    """Read-through cache in Redis, shared by all workers and nodes, of what the face
+    endpoints look up by user id: the primary template, all templates and the PIN.
+
+        emb:{user_id}     <emb_id i4><user_id i4><embedding bytes as stored in face_embeddings>
+        tpl:{user_id}     <primary emb_id i4, -1 without slot 0>(<length i4><embedding bytes>)* in slot order
+        pinref:{user_id}  <pin_id i4><emb_id i4>, whether there is a PIN; the hash stays in the database
+        gen:{user_id}     write generation
+
+    Writes bump the generation and delete the keys once committed (see FaceDao/FacePinDao);
+    a fill from a lookup that started before the write sees another generation and is
+    dropped, so a concurrent miss cannot put the deleted value back. Redis errors count as
+    misses, the cache never fails a request.
+    """
+
+    def __init__(self, host: str, port: int, db: int, ttl_s: float, prefix: str = "face:"):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.ttl_s = ttl_s
+        self.prefix = prefix
+        self._client = None
+        self._fill = None
+        self._down_until = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_s > 0 and time.monotonic() >= self._down_until
+
+    @property
+    def client(self) -> aioredis.Redis:
+        if self._client is None:
+            self._client = aioredis.Redis(host=self.host, port=self.port, db=self.db,
+                                          socket_timeout=1.0, socket_connect_timeout=1.0)
+        return self._client
+
+    def emb_key(self, user_id: int) -> str:
+        return f"{self.prefix}emb:{user_id}"
+
+    def tpl_key(self, user_id: int) -> str:
+        return f"{self.prefix}tpl:{user_id}"
+
+    def pin_key(self, user_id: int) -> str:
+        return f"{self.prefix}pinref:{user_id}"
+
+    def gen_key(self, user_id: int) -> str:
+        return f"{self.prefix}gen:{user_id}"
+
+    def _failed(self):
+        self.errors += 1
+        self._down_until = time.monotonic() + BACKOFF_S
+
+    async def get_many(self, user_id: int, keys: list[str]) -> tuple[list[bytes | None], bytes | None]:
+        """One pipelined round trip for the user's keys: (values, None for a miss) and the
+        generation to pass to set_many when filling the misses."""
+        if not self.enabled:
+            return [None] * len(keys), None
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.get(key)
+                pipe.get(self.gen_key(user_id))
+                *values, generation = await pipe.execute()
+        except RedisError:
+            self._failed()
+            return [None] * len(keys), None
+        hits = sum(value is not None for value in values)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return values, generation or b""
+
+    async def set_many(self, user_id: int, generation: bytes | None, items: dict[str, bytes]):
+        """Stores `items` unless the user was written since get_many returned `generation`."""
+        if not items or generation is None or not self.enabled:
+            return
+        try:
+            if self._fill is None:
+                self._fill = self.client.register_script(FILL_SCRIPT)
+            await self._fill(
+                keys=[self.gen_key(user_id), *items],
+                args=[generation, *items.values(), int(self.ttl_s * 1000)],
+            )
+        except RedisError:
+            self._failed()
+
+    async def invalidate(self, user_ids, emb: bool = True, pin: bool = True):
+        if self.ttl_s <= 0:
+            return
+        try:
+            async with self.client.pipeline(transaction=True) as pipe:
+                for user_id in user_ids:
+                    gen_key = self.gen_key(user_id)
+                    pipe.incr(gen_key)
+                    pipe.expire(gen_key, GENERATION_TTL_S)
+                    if emb:
+                        pipe.delete(self.emb_key(user_id), self.tpl_key(user_id))
+                    if pin:
+                        pipe.delete(self.pin_key(user_id))
+                await pipe.execute()
+        except RedisError:
+            # The entry may now outlive the write by up to ttl_s.
+            self._failed()
+
+    @staticmethod
+    def pack_emb(row) -> bytes:
+        return ABSENT if row is None else _IDS.pack(row.id, row.user_id) + row.embedding
+
+    @staticmethod
+    def unpack_emb(value: bytes):
+        """(emb_id, user_id, embedding) or None, like FaceDao.get_by_id."""
+        if value == ABSENT:
+            return None
+        emb_id, user_id = _IDS.unpack_from(value)
+        return emb_id, user_id, decode_embedding(value[_IDS.size:])
+
+    @staticmethod
+    def pack_templates(emb_id: int | None, templates: list[bytes]) -> bytes:
+        if not templates:
+            return ABSENT
+        return _I4.pack(-1 if emb_id is None else emb_id) + b"".join(_I4.pack(len(t)) + t for t in templates)
+
+    @staticmethod
+    def unpack_templates(value: bytes) -> tuple[int | None, list[bytes] | None]:
+        """(primary emb_id, stored embeddings in slot order), (None, None) for a user without any."""
+        if value == ABSENT:
+            return None, None
+        (emb_id,), pos, templates = _I4.unpack_from(value), _I4.size, []
+        while pos < len(value):
+            (size,) = _I4.unpack_from(value, pos)
+            pos += _I4.size
+            templates.append(value[pos:pos + size])
+            pos += size
+        return (None if emb_id < 0 else emb_id), templates
+
+    @staticmethod
+    def pack_pin(pin) -> bytes:
+        return ABSENT if pin is None else _IDS.pack(pin.id, pin.emb_id)
+
+    @staticmethod
+    def unpack_pin(value: bytes) -> tuple[int, int] | None:
+        if value == ABSENT:
+            return None
+        return _IDS.unpack(value)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+face_cache = FaceCache(
+    host=settings.REDIS_HOST,
+    port=settings.REDIS_PORT,
+    db=settings.FACE_CACHE_REDIS_DB,
+    ttl_s=settings.FACE_CACHE_TTL_S,
+)
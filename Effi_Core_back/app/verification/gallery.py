@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import threading
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+from app.config import settings
+from .ann import IVFPQIndex
+from .dao import FaceDao
+
+EMBED_DIM = settings.EMBED_DIM
+SLOT_BITS = 16
+
+logger = logging.getLogger(__name__)
+
+
+def template_keys(user_ids, slots) -> np.ndarray:
+    return (np.asarray(user_ids, dtype=np.int64) << SLOT_BITS) | np.asarray(slots, dtype=np.int64)
+
+
+class FaceGallery:
+    """All enrolled templates as one contiguous float32 matrix for 1:N search.
+
+    Row i of the matrix belongs to keys[i] = user_id << SLOT_BITS | slot; removal
+    swaps the last row into the hole so the live rows stay packed in [0, size).
+    Past ann_min_size rows an IVF-PQ index picks candidates that are then re-ranked
+    exactly. The index is trained once and kept across reloads, which only add and
+    remove the rows that changed; it is retrained when the row count has moved by more
+    than ANN_RETRAIN_CHANGE since training. A user is ranked by the nearest of their templates.
+
+    Every worker keeps its own copy and reloads the whole table every GALLERY_REFRESH_S (60 s
+    by default) to pick up writes made through other workers. A reload builds the new arrays
+    outside the lock and only swaps them in under it; writes made while it runs are journaled
+    and replayed onto the new state, so they are not lost to the older snapshot.
+    """
+
+    def __init__(self, dim: int = EMBED_DIM, capacity: int = 1024, ann_min_size: int = settings.GALLERY_ANN_MIN_SIZE):
+        self.dim = dim
+        # Highest slot + 1 seen so far: an upper bound on the templates of any one user.
+        self.templates = 1
+        self._matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self._sq_norms = np.zeros(capacity, dtype=np.float32)
+        self._keys = np.zeros(capacity, dtype=np.int64)
+        self._rows: dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.size = 0
+        self.loaded = False
+        self.ann_min_size = ann_min_size
+        self.index: IVFPQIndex | None = None
+        self._trained_size = 0
+        # Bumped by every upsert/remove, so load() can tell its index changes went stale.
+        self._writes = 0
+        # Writes since the running reload started, replayed onto its snapshot; None outside a reload.
+        self._journal: list | None = None
+
+    def _reserve(self, capacity: int):
+        if capacity <= len(self._matrix):
+            return
+        capacity = max(capacity, 2 * len(self._matrix))
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        sq_norms = np.zeros(capacity, dtype=np.float32)
+        keys = np.zeros(capacity, dtype=np.int64)
+        matrix[:self.size] = self._matrix[:self.size]
+        sq_norms[:self.size] = self._sq_norms[:self.size]
+        keys[:self.size] = self._keys[:self.size]
+        self._matrix, self._sq_norms, self._keys = matrix, sq_norms, keys
+
+    def build_index(self, keys: np.ndarray, matrix: np.ndarray) -> IVFPQIndex:
+        nlist = settings.ANN_NLIST or max(1, int(4 * np.sqrt(len(matrix))))
+        index = IVFPQIndex(self.dim, nlist=nlist, m=settings.ANN_M, nprobe=settings.ANN_NPROBE)
+        index.train(matrix)
+        index.add(keys, matrix)
+        return index
+
+    def _index_changes(self, keys: np.ndarray, matrix: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Keys of the current rows missing from `keys`, and positions in `keys` that are new
+        or whose embedding differs from the current row."""
+        old_keys = self._keys[:self.size]
+        if not len(old_keys):
+            return old_keys, np.arange(len(keys))
+        removed = np.setdiff1d(old_keys, keys, assume_unique=True)
+        order = np.argsort(old_keys)
+        pos = np.minimum(np.searchsorted(old_keys[order], keys), len(order) - 1)
+        old_rows = order[pos]
+        found = old_keys[old_rows] == keys
+        changed = ~found
+        both = np.flatnonzero(found)
+        for i in range(0, len(both), 65536):
+            idx = both[i:i + 65536]
+            changed[idx] = (self._matrix[old_rows[idx]] != matrix[idx]).any(axis=1)
+        return removed, np.flatnonzero(changed)
+
+    def load(self, user_ids: np.ndarray, matrix: np.ndarray, slots: np.ndarray | None = None):
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32).reshape(-1, self.dim)
+        n = len(matrix)
+        keys = template_keys(user_ids, np.zeros(n, dtype=np.int64) if slots is None else slots)
+        # The new state is built without the lock; writes and searches only wait for the swap.
+        new_matrix = np.zeros((max(n, 1024), self.dim), dtype=np.float32)
+        new_sq_norms = np.zeros(len(new_matrix), dtype=np.float32)
+        new_keys = np.zeros(len(new_matrix), dtype=np.int64)
+        new_matrix[:n] = matrix
+        np.einsum("ij,ij->i", matrix, matrix, out=new_sq_norms[:n])
+        new_keys[:n] = keys
+        rows = {key: i for i, key in enumerate(keys.tolist())}
+        templates = int(slots.max()) + 1 if slots is not None and n else 1
+
+        index, changes, writes, trained_size = None, None, self._writes, self._trained_size
+        if 0 < self.ann_min_size <= n:
+            index = self.index
+            if index is None or abs(n - trained_size) > settings.ANN_RETRAIN_CHANGE * trained_size:
+                index, trained_size = self.build_index(keys, matrix), n
+            else:
+                changes = self._index_changes(keys, matrix)
+        with self._lock:
+            if changes is not None:
+                if writes != self._writes:
+                    # Rows were written while the changes were computed; redo it against them.
+                    changes = self._index_changes(keys, matrix)
+                removed, changed = changes
+                index.remove(removed)
+                if len(changed):
+                    index.add(keys[changed], matrix[changed])
+            self.index = index
+            self._trained_size = trained_size
+            self._matrix, self._sq_norms, self._keys, self._rows = new_matrix, new_sq_norms, new_keys, rows
+            self.templates = templates
+            self.size = n
+            journal, self._journal = self._journal or [], None
+            for write, args in journal:
+                write(*args)
+            self.loaded = True
+
+    def _upsert(self, user_id: int, emb: np.ndarray, slot: int):
+        key = user_id << SLOT_BITS | slot
+        self._writes += 1
+        if self._journal is not None:
+            self._journal.append((self._upsert, (user_id, emb, slot)))
+        row = self._rows.get(key)
+        if row is None:
+            self._reserve(self.size + 1)
+            row = self.size
+            self.size += 1
+            self._rows[key] = row
+            self._keys[row] = key
+            self.templates = max(self.templates, slot + 1)
+        self._matrix[row] = emb
+        self._sq_norms[row] = emb @ emb
+        if self.index is not None:
+            self.index.add([key], emb)
+
+    def _remove(self, user_id: int):
+        self._writes += 1
+        if self._journal is not None:
+            self._journal.append((self._remove, (user_id,)))
+        rows = np.flatnonzero((self._keys[:self.size] >> SLOT_BITS) == user_id)
+        if self.index is not None and len(rows):
+            self.index.remove(self._keys[rows].tolist())
+        # Highest rows first, so the row swapped into a hole is never one still to be removed.
+        for row in rows[::-1].tolist():
+            del self._rows[int(self._keys[row])]
+            last = self.size - 1
+            if row != last:
+                self._matrix[row] = self._matrix[last]
+                self._sq_norms[row] = self._sq_norms[last]
+                self._keys[row] = self._keys[last]
+                self._rows[int(self._keys[row])] = row
+            self.size = last
+
+    def upsert(self, user_id: int, emb: np.ndarray, slot: int = 0):
+        emb = np.asarray(emb, dtype=np.float32).reshape(-1)
+        if emb.shape[0] != self.dim:
+            return
+        with self._lock:
+            self._upsert(user_id, emb, slot)
+
+    def remove(self, user_id: int):
+        """Drops all templates of the user."""
+        with self._lock:
+            self._remove(user_id)
+
+    async def upsert_async(self, user_id: int, emb: np.ndarray, slot: int = 0):
+        await run_in_threadpool(self.upsert, user_id, emb, slot)
+
+    async def remove_async(self, user_id: int):
+        await run_in_threadpool(self.remove, user_id)
+
+    def search(self, q: np.ndarray, k: int) -> list[tuple[int, float]]:
+        q = np.asarray(q, dtype=np.float32).reshape(-1)
+        with self._lock:
+            n = self.size
+            if n == 0:
+                return []
+            # The best k * templates rows always contain the nearest template of each of the best k users.
+            m = k * self.templates
+            if self.index is not None:
+                ids, _ = self.index.search(q, m * settings.ANN_REFINE)
+                rows = np.array([self._rows[int(i)] for i in ids], dtype=np.int64)
+                if len(rows) == 0:
+                    return []
+            else:
+                rows = slice(0, n)
+            # ||m - q||^2 = ||m||^2 - 2 m.q + ||q||^2, one matrix-vector product for all candidates.
+            d2 = self._sq_norms[rows] - 2.0 * (self._matrix[rows] @ q) + q @ q
+            user_ids = self._keys[rows] >> SLOT_BITS
+            m = min(m, len(d2))
+            top = np.argpartition(d2, m - 1)[:m] if m < len(d2) else np.arange(len(d2))
+            top = top[np.argsort(d2[top], kind="stable")]
+            _, first = np.unique(user_ids[top], return_index=True)
+            top = top[np.sort(first)[:k]]
+            dists = np.sqrt(np.maximum(d2[top], 0.0))
+            return [(int(uid), float(d)) for uid, d in zip(user_ids[top], dists)]
+
+    async def search_async(self, q: np.ndarray, k: int) -> list[tuple[int, float]]:
+        return await run_in_threadpool(self.search, q, k)
+
+    async def reload(self):
+        # Journal from before the snapshot is read: a write it misses is replayed, one it has is
+        # replayed harmlessly (same value, or a removal of rows already gone).
+        with self._lock:
+            self._journal = []
+        try:
+            user_ids, slots, matrix = await FaceDao.load_embeddings(self.dim)
+            await run_in_threadpool(self.load, user_ids, matrix, slots)
+        finally:
+            with self._lock:
+                self._journal = None
+
+    async def run_refresh(self, interval_s: float):
+        # Writes are applied incrementally in the worker that handles them; the periodic
+        # reload picks up enrollments made through other workers.
+        while True:
+            try:
+                await self.reload()
+            except Exception:
+                logger.exception("face gallery reload failed")
+            if interval_s <= 0:
+                return
+            await asyncio.sleep(interval_s)
+
+
+face_gallery = FaceGallery()
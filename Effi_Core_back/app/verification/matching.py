@@ -0,0 +1,23 @@
+from typing import get_args
+
+import numpy as np
+
+from app.config import TemplateScoring, settings
+
+SCORING = get_args(TemplateScoring)
+
+
+def template_distance(q: np.ndarray, templates: np.ndarray, scoring: str = settings.TEMPLATE_SCORING) -> float:
+    """L2 distance between the probe and all of a user's templates [t, dim] at once.
+
+    max - nearest template (one bad enrollment photo does not hurt),
+    mean - average distance over the templates,
+    centroid - distance to the mean template, renormalised like the model output.
+    """
+    templates = np.asarray(templates, dtype=np.float32).reshape(-1, q.shape[0])
+    if scoring == "centroid":
+        centroid = templates.mean(axis=0)
+        norm = np.linalg.norm(centroid)
+        return float(np.linalg.norm(centroid / norm - q)) if norm > 0 else float("inf")
+    dists = np.linalg.norm(templates - q, axis=1)
+    return float(dists.mean() if scoring == "mean" else dists.min())
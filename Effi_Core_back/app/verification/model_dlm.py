@@ -2,8 +2,13 @@ from PIL import Image
 from fastapi.concurrency import run_in_threadpool
 import torchvision.transforms as T
 from functools import lru_cache
+from .batching import BatchStats, EmbeddingBatcher
+from .engines import ENGINES, OnnxEmbeddingNet, load_int8, load_torchscript
 from .model_impl import EmbeddingNet, SiameseNet
+from .model_server import ModelClient
+from .preprocess import open_image, preprocess_image
 from app.config import settings
+from app.metrics import timed
 import torch
 import numpy as np
 from torch.serialization import safe_globals
@@ -12,6 +17,11 @@ IMG_SIZE = settings.IMG_SIZE
 MODEL_WEIGHTS_PATH = settings.MODEL_WEIGHTS_PATH
 DEVICE = settings.get_device()
 EMBED_DIM = settings.EMBED_DIM
+MODEL_ENGINE = settings.MODEL_ENGINE.lower()
+BATCH_MAX_SIZE = settings.BATCH_MAX_SIZE
+BATCH_MAX_WAIT_MS = settings.BATCH_MAX_WAIT_MS
+MODEL_SERVER_SOCKET = settings.MODEL_SERVER_SOCKET
+FAST_PREPROCESS = settings.FAST_PREPROCESS
 eval_transform = T.Compose([
     T.Resize((IMG_SIZE, IMG_SIZE)),
     T.ToTensor(),
@@ -19,7 +29,16 @@ eval_transform = T.Compose([
 ])
 
 
-def load_model(weights_path=MODEL_WEIGHTS_PATH, device=DEVICE):
+def load_model(weights_path=MODEL_WEIGHTS_PATH, device=DEVICE, engine=MODEL_ENGINE):
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown MODEL_ENGINE {engine!r}, expected one of {ENGINES}")
+    if engine == "torchscript":
+        return load_torchscript(settings.MODEL_TORCHSCRIPT_PATH, device)
+    if engine == "onnx":
+        return OnnxEmbeddingNet(settings.MODEL_ONNX_PATH, settings.ONNX_INTRA_OP_THREADS)
+    if engine == "int8":
+        return load_int8(settings.MODEL_INT8_PATH, settings.QUANT_BACKEND, settings.QUANT_EER_TOLERANCE)
+
     emb = EmbeddingNet(embedding_dim=EMBED_DIM, pretrained=False)
     model = SiameseNet(emb)
 
@@ -31,22 +50,132 @@ def load_model(weights_path=MODEL_WEIGHTS_PATH, device=DEVICE):
     model.eval()
     return model
 
+def get_model_client() -> ModelClient:
+    shm_size = max(1, BATCH_MAX_SIZE, settings.ENROLL_BATCH_SIZE) * max(3 * IMG_SIZE * IMG_SIZE, EMBED_DIM) * 4
+    return ModelClient(
+        MODEL_SERVER_SOCKET,
+        replicas=settings.MODEL_SERVER_REPLICAS,
+        max_connections=settings.MODEL_SERVER_CONNECTIONS,
+        shm_size=shm_size,
+    )
+
 @lru_cache(maxsize=1)
 def get_model():
+    if MODEL_SERVER_SOCKET:
+        return get_model_client()
     return load_model()
 
 
-def _compute_embedding_sync(model, pil_image: Image.Image, transform=eval_transform, device=DEVICE):
-    x = transform(pil_image).unsqueeze(0).to(device)
+_model_ready = False
+
+def is_model_ready() -> bool:
+    return _model_ready
+
+
+def warmup_model(model, batch_sizes=None, rounds=settings.WARMUP_ROUNDS, device=DEVICE):
+    for n in batch_sizes or settings.get_warmup_batch_sizes():
+        x = torch.zeros((n, 3, IMG_SIZE, IMG_SIZE))
+        for _ in range(rounds):
+            _forward_batch_sync(model, x, device)
+
+
+def prepare_model():
+    """Loads and warms up the in-process model; used before forking workers."""
+    global _model_ready
+    model = get_model()
+    if not isinstance(model, ModelClient):
+        warmup_model(model)
+    _model_ready = True
+    return model
+
+
+async def prepare_model_async():
+    global _model_ready
+    if _model_ready:
+        return
+    model = await run_in_threadpool(get_model)
+    if isinstance(model, ModelClient):
+        await model.infer(torch.zeros((1, 3, IMG_SIZE, IMG_SIZE)))
+    else:
+        await run_in_threadpool(warmup_model, model)
+    _model_ready = True
+
 
-    try:
-        x = x.to(memory_format=torch.channels_last)
-    except Exception:
-        pass
+def _forward_batch_sync(model, x: torch.Tensor, device=DEVICE) -> np.ndarray:
+    x = x.to(device)
+
+    if getattr(model, "channels_last", True):
+        try:
+            x = x.to(memory_format=torch.channels_last)
+        except Exception:
+            pass
     with torch.no_grad():
         emb = model.embedding_net(x) if hasattr(model, "embedding_net") else model(x)
-        emb = emb.detach().cpu().squeeze(0).to(dtype=torch.float32).numpy()
+        emb = emb.detach().cpu().to(dtype=torch.float32).numpy()
     return emb
 
-async def compute_embedding_async(model, pil_image: Image.Image, transform=eval_transform, device=DEVICE):
-    return await run_in_threadpool(_compute_embedding_sync, model, pil_image, transform, device)
+
+def _compute_embedding_sync(model, pil_image: Image.Image, transform=eval_transform, device=DEVICE):
+    with timed("transform"):
+        x = transform(pil_image).unsqueeze(0)
+    with timed("forward"):
+        return _forward_batch_sync(model, x, device)[0]
+
+
+def _transform_sync(transform, pil_image: Image.Image) -> torch.Tensor:
+    with timed("transform"):
+        return transform(pil_image)
+
+
+async def _run_batch(model, x: torch.Tensor, device=DEVICE) -> np.ndarray:
+    if isinstance(model, ModelClient):
+        return await model.infer(x)
+    return await run_in_threadpool(_forward_batch_sync, model, x, device)
+
+
+async def compute_embeddings_batch_async(model, x: torch.Tensor, device=DEVICE) -> np.ndarray:
+    """[B,3,H,W] already batched input -> [B, EMBED_DIM]; skips the micro-batcher."""
+    return await _run_batch(model, x, device)
+
+
+_batchers = {}
+
+def get_batcher(model, device=DEVICE) -> EmbeddingBatcher:
+    key = (id(model), str(device))
+    entry = _batchers.get(key)
+    if entry is None or entry[0] is not model:
+        async def runner(x):
+            return await _run_batch(model, x, device)
+        entry = (model, EmbeddingBatcher(runner, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS))
+        _batchers[key] = entry
+    return entry[1]
+
+
+def batch_stats() -> dict[str, BatchStats]:
+    """Stats of every batcher created by get_batcher, by device."""
+    return {device: batcher.stats for (_, device), (_, batcher) in _batchers.items()}
+
+
+def _decode_sync(content) -> Image.Image | torch.Tensor:
+    if FAST_PREPROCESS:
+        return preprocess_image(content, IMG_SIZE)
+    with timed("decode"):
+        return open_image(content).convert("RGB")
+
+async def decode_image_async(content) -> Image.Image | torch.Tensor:
+    return await run_in_threadpool(_decode_sync, content)
+
+
+async def compute_embedding_async(model, image: Image.Image | torch.Tensor, transform=eval_transform, device=DEVICE):
+    """`image` is either a PIL image for `transform` or a [3,H,W] tensor from preprocess_image."""
+    if isinstance(image, torch.Tensor):
+        x = image
+    elif BATCH_MAX_SIZE <= 1 and not isinstance(model, ModelClient):
+        return await run_in_threadpool(_compute_embedding_sync, model, image, transform, device)
+    else:
+        x = await run_in_threadpool(_transform_sync, transform, image)
+    # With batching this includes the wait for the batch to fill.
+    with timed("forward"):
+        if BATCH_MAX_SIZE <= 1:
+            return (await _run_batch(model, x.unsqueeze(0), device))[0]
+        return await get_batcher(model, device).submit(x)
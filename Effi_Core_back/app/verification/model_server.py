@@ -0,0 +1,219 @@
+import argparse
+import asyncio
+import itertools
+import os
+import signal
+import socket
+import socketserver
+import struct
+import threading
+import multiprocessing as mp
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import torch
+
+from app.config import settings
+
+# Wire protocol. Tensors never travel over the socket: the client owns a shared
+# memory segment per connection, writes the [N,C,H,W] float32 batch into it and
+# the server overwrites it with the [N,EMBED_DIM] float32 embeddings.
+ATTACH = struct.Struct("!I")          # shm name length, followed by the name
+REQUEST = struct.Struct("!4I")        # n, c, h, w
+RESPONSE = struct.Struct("!B2I")      # status, n, d (status != 0: d is error length)
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+
+def replica_socket_path(base_path: str, replica: int) -> str:
+    return f"{base_path}.{replica}"
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes | None:
+    buf = bytearray(size)
+    view = memoryview(buf)
+    got = 0
+    while got < size:
+        n = sock.recv_into(view[got:])
+        if n == 0:
+            return None
+        got += n
+    return bytes(buf)
+
+
+def _attach_shm(name: str) -> SharedMemory:
+    shm = SharedMemory(name=name)
+    # The client owns the segment; keep our resource tracker from unlinking it on exit.
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+class _InferenceHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        sock = self.request
+        head = _recv_exact(sock, ATTACH.size)
+        if head is None:
+            return
+        name = _recv_exact(sock, ATTACH.unpack(head)[0])
+        if name is None:
+            return
+        shm = _attach_shm(name.decode())
+        try:
+            while True:
+                head = _recv_exact(sock, REQUEST.size)
+                if head is None:
+                    break
+                sock.sendall(self._infer(shm, *REQUEST.unpack(head)))
+        finally:
+            shm.close()
+
+    def _infer(self, shm: SharedMemory, n: int, c: int, h: int, w: int) -> bytes:
+        try:
+            x = torch.from_numpy(np.ndarray((n, c, h, w), dtype=np.float32, buffer=shm.buf))
+            emb = self.server.infer(x)
+            np.ndarray(emb.shape, dtype=np.float32, buffer=shm.buf)[...] = emb
+            return RESPONSE.pack(STATUS_OK, *emb.shape)
+        except Exception as exc:
+            msg = f"{type(exc).__name__}: {exc}".encode()
+            return RESPONSE.pack(STATUS_ERROR, n, len(msg)) + msg
+
+
+class InferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, model):
+        from .model_dlm import _forward_batch_sync
+
+        self.model = model
+        self._forward = _forward_batch_sync
+        self._lock = threading.Lock()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, _InferenceHandler)
+
+    def infer(self, x: torch.Tensor) -> np.ndarray:
+        with self._lock:
+            return self._forward(self.model, x)
+
+
+def serve(socket_path: str, threads: int = 0):
+    from .model_dlm import load_model, warmup_model
+
+    if threads > 0:
+        torch.set_num_threads(threads)
+    model = load_model()
+    warmup_model(model)
+    server = InferenceServer(socket_path, model)
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+class _Connection:
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, shm: SharedMemory):
+        self.reader = reader
+        self.writer = writer
+        self.shm = shm
+
+    @classmethod
+    async def open(cls, socket_path: str, shm_size: int) -> "_Connection":
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+        shm = SharedMemory(create=True, size=shm_size)
+        name = shm.name.encode()
+        writer.write(ATTACH.pack(len(name)) + name)
+        await writer.drain()
+        return cls(reader, writer, shm)
+
+    async def infer(self, x: torch.Tensor) -> np.ndarray:
+        x = x.detach().cpu().to(dtype=torch.float32)
+        n, c, h, w = x.shape
+        if x.numel() * 4 > self.shm.size:
+            raise ValueError(f"batch of {n} does not fit into the shared memory segment")
+        np.ndarray((n, c, h, w), dtype=np.float32, buffer=self.shm.buf)[...] = x.numpy()
+        self.writer.write(REQUEST.pack(n, c, h, w))
+        await self.writer.drain()
+
+        status, n_out, d = RESPONSE.unpack(await self.reader.readexactly(RESPONSE.size))
+        if status != STATUS_OK:
+            raise RuntimeError((await self.reader.readexactly(d)).decode(errors="replace"))
+        return np.ndarray((n_out, d), dtype=np.float32, buffer=self.shm.buf).copy()
+
+    def close(self):
+        self.writer.close()
+        self.shm.close()
+        self.shm.unlink()
+
+
+class ModelClient:
+    """Async client for a pool of inference server replicas.
+
+    Stands in for the model object in API workers: compute_embedding_async sends
+    it the preprocessed batch instead of running the forward in-process.
+    """
+
+    def __init__(self, socket_path: str, replicas: int, max_connections: int, shm_size: int):
+        self.paths = [replica_socket_path(socket_path, i) for i in range(max(1, replicas))]
+        self.shm_size = shm_size
+        self._next_path = itertools.cycle(self.paths)
+        self._max_connections = max(1, max_connections)
+        self._idle: list[_Connection] = []
+        self._slots = None
+
+    async def infer(self, x: torch.Tensor) -> np.ndarray:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._max_connections)
+        async with self._slots:
+            conn = self._idle.pop() if self._idle else await _Connection.open(next(self._next_path), self.shm_size)
+            try:
+                out = await conn.infer(x)
+            except BaseException:
+                conn.close()
+                raise
+            self._idle.append(conn)
+            return out
+
+    def close(self):
+        while self._idle:
+            self._idle.pop().close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Out-of-process EmbeddingNet inference server")
+    parser.add_argument("--socket", default=settings.MODEL_SERVER_SOCKET)
+    parser.add_argument("--replicas", type=int, default=settings.MODEL_SERVER_REPLICAS)
+    parser.add_argument("--threads", type=int, default=settings.MODEL_SERVER_THREADS)
+    args = parser.parse_args()
+    if not args.socket:
+        parser.error("set MODEL_SERVER_SOCKET or pass --socket")
+
+    ctx = mp.get_context("spawn")
+    procs = [
+        ctx.Process(target=serve, args=(replica_socket_path(args.socket, i), args.threads), daemon=True)
+        for i in range(max(1, args.replicas))
+    ]
+    for proc in procs:
+        proc.start()
+
+    def stop(*_):
+        for proc in procs:
+            proc.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for proc in procs:
+        proc.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+import hashlib
+from functools import lru_cache
+
+from app.config import settings
+
+
+def model_path(engine: str) -> str:
+    return {
+        "torchscript": settings.MODEL_TORCHSCRIPT_PATH,
+        "onnx": settings.MODEL_ONNX_PATH,
+        "int8": settings.MODEL_INT8_PATH,
+    }.get(engine, settings.MODEL_WEIGHTS_PATH)
+
+
+@lru_cache
+def get_model_version(engine: str = settings.MODEL_ENGINE.lower()) -> str:
+    """MODEL_VERSION, else the engine and a digest of its model file's contents, so the same
+    weights give the same version wherever the file is copied. Kept free of torch: the DAO
+    stamps model_id(version) into every stored embedding."""
+    if settings.MODEL_VERSION:
+        return settings.MODEL_VERSION
+    path = model_path(engine)
+    try:
+        with open(path, "rb") as f:
+            digest = hashlib.file_digest(f, lambda: hashlib.blake2b(digest_size=16)).hexdigest()
+    except OSError:
+        return f"{engine}:{path}"
+    return f"{engine}:{digest}"
@@ -1,16 +1,24 @@
-from sqlalchemy import Column, Integer, String, LargeBinary,Boolean, ForeignKey, DateTime, func
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, SmallInteger, String, LargeBinary,Boolean, ForeignKey, DateTime, Index, func
+from sqlalchemy.orm import relationship, deferred
+from app.config import settings
 from ..database import Base
+from .vector import Vector
 
 class FaceEmbedding(Base):
     __tablename__ = "face_embeddings"
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), unique=True, nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    slot = Column(SmallInteger, nullable=False, default=0, server_default="0")
     embedding = Column(LargeBinary, nullable=False)
+    if settings.EMBEDDING_STORE == "pgvector":
+        # Mirror of `embedding` for distance/top-k queries inside Postgres; not loaded with the row.
+        embedding_vec = deferred(Column(Vector(settings.EMBED_DIM), nullable=True))
     meta = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
-    user = relationship("Users", back_populates="embedding", uselist=False)
+    user = relationship("Users", back_populates="embeddings")
+
+    __table_args__ = (Index("uq_face_embeddings_user_slot", "user_id", "slot", unique=True),)
 
 
 class FacePin(Base):
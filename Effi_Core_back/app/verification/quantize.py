@@ -0,0 +1,151 @@
+import argparse
+import copy
+import csv
+import importlib.util
+import json
+import os
+import sys
+
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import DataLoader
+
+from app.config import settings
+from .engines import int8_report_path
+from .export import IMG_EXTENSIONS
+from .model_dlm import IMG_SIZE, MODEL_WEIGHTS_PATH, eval_transform, load_model
+
+DLM_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))), "Efficore-DLM")
+
+
+def load_pairs_dataset_cls(dlm_dir: str):
+    spec = importlib.util.spec_from_file_location("efficore_dlm_datasets", os.path.join(dlm_dir, "datasets.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.LFWDatasetPairs
+
+
+def read_pairs(pairs_path: str, data_root: str) -> list[tuple[str, str, int]]:
+    pairs = []
+    with open(pairs_path, newline="") as f:
+        for row in csv.reader(f):
+            if not row or row[0].startswith("#"):
+                continue
+            p1, p2, label = row[0].strip(), row[1].strip(), int(row[2])
+            pairs.append((os.path.join(data_root, p1), os.path.join(data_root, p2), label))
+    return pairs
+
+
+def calibration_batches(images_dir: str, batch_size: int, limit: int):
+    files = sorted(f for f in os.listdir(images_dir) if f.lower().endswith(IMG_EXTENSIONS))[:limit]
+    for i in range(0, len(files), batch_size):
+        chunk = files[i:i + batch_size]
+        yield torch.stack([eval_transform(Image.open(os.path.join(images_dir, f)).convert("RGB")) for f in chunk])
+
+
+def quantize_static(embedding_net: torch.nn.Module, calib_dir: str, backend: str, batch_size: int, limit: int):
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    torch.backends.quantized.engine = backend
+    model = copy.deepcopy(embedding_net).cpu().eval()
+    example = (torch.randn((1, 3, IMG_SIZE, IMG_SIZE)),)
+    prepared = prepare_fx(model, get_default_qconfig_mapping(backend), example_inputs=example)
+    with torch.no_grad():
+        for x in calibration_batches(calib_dir, batch_size, limit):
+            prepared(x)
+    quantized = convert_fx(prepared)
+    with torch.no_grad():
+        scripted = torch.jit.freeze(torch.jit.trace(quantized, example))
+    return scripted
+
+
+def pair_distances(model, dataset, batch_size: int) -> tuple[np.ndarray, np.ndarray]:
+    dists, labels = [], []
+    with torch.no_grad():
+        for img1, img2, label in DataLoader(dataset, batch_size=batch_size):
+            e1, e2 = model(img1), model(img2)
+            dists.append(torch.linalg.vector_norm(e1 - e2, dim=1).numpy())
+            labels.append(label.numpy())
+    return np.concatenate(dists), np.concatenate(labels).astype(bool)
+
+
+def equal_error_rate(dists: np.ndarray, same: np.ndarray) -> tuple[float, float]:
+    order = np.argsort(dists, kind="stable")
+    d, s = dists[order], same[order]
+    n_pos, n_neg = s.sum(), (~s).sum()
+    if n_pos == 0 or n_neg == 0:
+        raise ValueError("pairs set needs both positive and negative pairs")
+    # Accept when dist <= threshold: FAR grows and FRR shrinks as the threshold moves right.
+    far = np.cumsum(~s) / n_neg
+    frr = 1 - np.cumsum(s) / n_pos
+    i = int(np.argmin(np.abs(far - frr)))
+    return float((far[i] + frr[i]) / 2), float(d[i])
+
+
+def distance_summary(dists: np.ndarray) -> dict:
+    return {
+        "mean": float(dists.mean()),
+        "std": float(dists.std()),
+        "p05": float(np.percentile(dists, 5)),
+        "p50": float(np.percentile(dists, 50)),
+        "p95": float(np.percentile(dists, 95)),
+    }
+
+
+def compare(fp32_model, int8_model, dataset, batch_size: int) -> dict:
+    d32, same = pair_distances(fp32_model, dataset, batch_size)
+    d8, _ = pair_distances(int8_model, dataset, batch_size)
+    eer32, thr32 = equal_error_rate(d32, same)
+    eer8, thr8 = equal_error_rate(d8, same)
+    return {
+        "pairs": int(len(same)),
+        "fp32": {"eer": eer32, "eer_threshold": thr32,
+                 "positive": distance_summary(d32[same]), "negative": distance_summary(d32[~same])},
+        "int8": {"eer": eer8, "eer_threshold": thr8,
+                 "positive": distance_summary(d8[same]), "negative": distance_summary(d8[~same])},
+        "distance_shift": distance_summary(d8 - d32),
+        "eer_delta": eer8 - eer32,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Static INT8 post-training quantization of EmbeddingNet")
+    parser.add_argument("--weights", default=MODEL_WEIGHTS_PATH)
+    parser.add_argument("--calib-images", required=True, help="directory with face images for calibration")
+    parser.add_argument("--calib-limit", type=int, default=512)
+    parser.add_argument("--pairs", required=True, help="csv of path1,path2,label (1 = same person)")
+    parser.add_argument("--data-root", default="", help="prefix for relative paths in --pairs")
+    parser.add_argument("--dlm-dir", default=DLM_DIR, help="Efficore-DLM checkout providing LFWDatasetPairs")
+    parser.add_argument("--backend", default=settings.QUANT_BACKEND, choices=("x86", "fbgemm", "qnnpack"))
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--eer-tolerance", type=float, default=settings.QUANT_EER_TOLERANCE)
+    parser.add_argument("--out", default=settings.MODEL_INT8_PATH)
+    args = parser.parse_args()
+
+    fp32 = load_model(args.weights, device=torch.device("cpu"), engine="eager").embedding_net
+    int8 = quantize_static(fp32, args.calib_images, args.backend, args.batch_size, args.calib_limit)
+
+    LFWDatasetPairs = load_pairs_dataset_cls(args.dlm_dir)
+    dataset = LFWDatasetPairs(read_pairs(args.pairs, args.data_root), transform=eval_transform)
+    report = compare(fp32, int8, dataset, args.batch_size)
+    report.update({
+        "backend": args.backend,
+        "eer_tolerance": args.eer_tolerance,
+        "accepted": report["eer_delta"] <= args.eer_tolerance,
+    })
+    print(json.dumps(report, indent=2))
+
+    if not report["accepted"]:
+        print(f"INT8 model refused: EER worse by {report['eer_delta']:.4f} > {args.eer_tolerance}", file=sys.stderr)
+        sys.exit(1)
+
+    int8.save(args.out)
+    with open(int8_report_path(args.out), "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"saved {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,78 @@
+import asyncio
+import zipfile
+
 import numpy as np
 from app.config import settings
-from .model_dlm import compute_embedding_async, eval_transform, get_model
-from .dao import FaceDao, FacePinDao
-from app.exceptions import IncorrectUserEmailOrPasswordException, EmailNotConfirmedException, InvalidImg, NoOpenImg, \
-    EmptyFile, InvalidEmb, FileTooLarge, EmbMiss, NoVerificationExc, NoGivenToken, NoEmbForUser, CantSaveEmb
+from .model_dlm import compute_embedding_async, decode_image_async, eval_transform, get_model
+from .codec import decode_embedding
+from .dao import FaceDao, FacePinDao, PGVECTOR
+from .embedding_cache import embedding_cache
+from .enroll import enroll, multipart_items, zip_items
+from .gallery import face_gallery
+from .admission import AdmissionGate, inference_gates, request_deadline
+from .matching import template_distance
+from .upload import read_upload
+from app.exceptions import IncorrectUserEmailOrPasswordException, EmailNotConfirmedException, NoOpenImg, \
+    InvalidEmb, EmbMiss, NoVerificationExc, NoGivenToken, NoEmbForUser, CantSaveEmb, \
+    GalleryNotLoaded, InvalidEnrollBatch, EnrollBatchTooLarge, TooManyTemplates, InvalidTemplateSlot
 from app.user.auth import JwtController
-from app.user.dao import UserDao
-from app.user.dependencies import get_current_user_to_access, get_current_user_to_refresh, http_bearer
+from app.user.dependencies import get_current_admin, get_current_user_to_access, get_current_user_to_refresh, http_bearer
 from app.user.schema import SUserAuthFace, TokenInfo
-import io
-from PIL import Image
 from fastapi import status, HTTPException, Response, UploadFile, File, Form, Depends, APIRouter
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import request_session
 from fastapi.responses import JSONResponse
 
 THRESHOLD_DEFAULT= settings.THRESHOLD_DEFAULT
-MAX_FILE_SIZE = settings.get_max_file_size()
 router = APIRouter(
     prefix='/face',
     tags=['Face'],
     dependencies=[Depends(http_bearer)],
 )
 
+async def embed_content(model, content):
+    try:
+        image = await decode_image_async(content)
+    except Exception:
+        raise NoOpenImg
+    return await compute_embedding_async(model, image, transform=eval_transform)
+
+
+async def query_embedding(model, file: UploadFile, gate: AdmissionGate | None = None,
+                          deadline: float | None = None) -> np.ndarray:
+    """Embedding of the upload; a cache miss is computed through the endpoint's admission gate."""
+    content = await read_upload(file)
+
+    async def compute():
+        if gate is None:
+            return await embed_content(model, content)
+        return await gate.run(lambda: embed_content(model, content), deadline)
+
+    try:
+        q_emb = await embedding_cache.get_or_compute(content, compute)
+    except HTTPException:
+        raise
+    except Exception as exc:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Ошибка вычисления эмбеддинга: {exc}")
+
+    q_emb = np.asarray(q_emb, dtype="float32").reshape(-1)
+    if q_emb.size == 0 or not np.isfinite(q_emb).all():
+        raise InvalidEmb
+    return q_emb
+
+
+def discard(task: asyncio.Future):
+    # Cancel a task whose result is no longer needed, or consume its exception so it isn't logged.
+    if not task.done():
+        task.cancel()
+    elif not task.cancelled():
+        task.exception()
+
+
 @router.get("/status")
-async def get_emb_by_user(current_user = Depends(get_current_user_to_access),):
+async def get_emb_by_user(current_user = Depends(get_current_user_to_access), session: AsyncSession = request_session):
     user_id = current_user.id
-    row = await FaceDao.get_by_id(user_id)
+    row = await FaceDao.get_by_id(user_id, session=session)
     return {'emb': bool(row)}
 
 @router.post("/create")
@@ -33,79 +81,81 @@ async def register_face(
     file: UploadFile = File(...),
     meta: str | None = Form(None),
     model = Depends(get_model),
+    session: AsyncSession = request_session,
+    deadline: float | None = Depends(request_deadline),
 ):
-    if file.content_type.split("/")[0] != "image":
-        raise InvalidImg
-    content = await file.read()
+    emb = await query_embedding(model, file, inference_gates.get("create"), deadline)
     try:
-        pil = Image.open(io.BytesIO(content)).convert("RGB")
-    except Exception:
-        raise NoOpenImg
-
-    emb = await compute_embedding_async(model, pil, transform=eval_transform)
-    if emb.shape[0] == 0 or not np.isfinite(emb).all():
-        raise InvalidEmb
-    try:
-        obj = await FaceDao.add_one(user_id=user_id, emb=emb, meta=meta)
+        obj = await FaceDao.add_one(user_id=user_id, emb=emb, meta=meta, session=session)
     except Exception:
         raise CantSaveEmb
+    await FaceDao.after_commit(session, lambda: face_gallery.upsert_async(user_id, emb))
     return {"ok": True, "embedding_id": obj.id}
 
 
 
+@router.post("/enroll/bulk")
+async def enroll_bulk(
+    files: list[UploadFile] | None = File(None),
+    user_ids: list[int] | None = Form(None),
+    archive: UploadFile | None = File(None),
+    model = Depends(get_model),
+    admin = Depends(get_current_admin),
+):
+    if archive is not None:
+        if files:
+            raise InvalidEnrollBatch
+        try:
+            items = zip_items(archive)
+        except zipfile.BadZipFile:
+            raise InvalidEnrollBatch
+    elif files and user_ids and len(files) == len(user_ids):
+        items = multipart_items(files, user_ids)
+    else:
+        raise InvalidEnrollBatch
+    if len(items) > settings.ENROLL_MAX_ITEMS:
+        raise EnrollBatchTooLarge
+    return await enroll(model, items)
+
+
 @router.post("/verify", response_model=TokenInfo)
 async def verify_face(
     response: Response,
     email: str = Form(...),
     file: UploadFile = File(...),
     model = Depends(get_model),
+    session: AsyncSession = request_session,
+    deadline: float | None = Depends(request_deadline),
 ) -> TokenInfo:
     user_data = SUserAuthFace(email=email)
-    user = await UserDao.get_by_filter_or_none(email=user_data.email)
-    if not user:
-        raise IncorrectUserEmailOrPasswordException
-    if not user.email_confirmed:
-        raise EmailNotConfirmedException
-
-    if file.content_type.split("/")[0] != "image":
-        raise InvalidImg
-    content = await file.read()
-    if not content:
-        raise EmptyFile
-    if len(content) > MAX_FILE_SIZE:
-        raise FileTooLarge
-    try:
-        pil = Image.open(io.BytesIO(content)).convert("RGB")
-    except Exception:
-        raise NoOpenImg
-
+    # The lookup is one joined query and runs while the model computes the embedding.
+    lookup = asyncio.ensure_future(FaceDao.get_verify_data(user_data.email, session=session))
+    embedding = asyncio.ensure_future(query_embedding(model, file, inference_gates.get("verify"), deadline))
     try:
-        q_emb = await compute_embedding_async(model, pil, transform=eval_transform)
-    except Exception as exc:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Ошибка вычисления эмбеддинга: {exc}")
-
-    q_emb = np.asarray(q_emb, dtype="float32").reshape(-1)
-    if q_emb.size == 0 or not np.isfinite(q_emb).all():
-        raise InvalidEmb
-
-    row = await FaceDao.get_by_id(user.id)
-    if row is None:
+        user = await lookup
+        if not user or not user.is_active:
+            raise IncorrectUserEmailOrPasswordException
+        if not user.email_confirmed:
+            raise EmailNotConfirmedException
+        q_emb = await embedding
+    finally:
+        discard(lookup)
+        discard(embedding)
+
+    if user.emb_id is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Эмбеддинг для пользователя не найден")
 
-    emb_id, emb_user_id, stored_emb = row
-    stored_emb = np.asarray(stored_emb, dtype="float32").reshape(-1)
-
-    if stored_emb.shape[0] != q_emb.shape[0]:
+    emb_id = user.emb_id
+    templates = [emb for emb in map(decode_embedding, user.templates) if emb.shape[0] == q_emb.shape[0]]
+    if not templates:
         raise EmbMiss
 
-    dist = float(np.linalg.norm(stored_emb - q_emb))
-    print(dist)
+    dist = template_distance(q_emb, np.stack(templates))
     match = dist <= THRESHOLD_DEFAULT
     if not match:
         raise NoVerificationExc
 
-    pin_obj = await FacePinDao.get_by_emb_id(emb_id)
-    if pin_obj:
+    if user.has_pin:
         return JSONResponse(
             status_code=status.HTTP_202_ACCEPTED,
             content={
@@ -124,22 +174,47 @@ async def verify_face(
     return TokenInfo(efficore_token=access_token, refresh_token=refresh_token)
 
 
+@router.post("/identify")
+async def identify_face(
+    file: UploadFile = File(...),
+    model = Depends(get_model),
+    admin = Depends(get_current_admin),
+    session: AsyncSession = request_session,
+    deadline: float | None = Depends(request_deadline),
+):
+    """Nearest enrolled user within THRESHOLD_DEFAULT; the ranking itself is not exposed."""
+    use_gallery = face_gallery.loaded
+    if not use_gallery and not PGVECTOR:
+        raise GalleryNotLoaded
+    q_emb = await query_embedding(model, file, inference_gates.get("identify"), deadline)
+    if q_emb.shape[0] != face_gallery.dim:
+        raise EmbMiss
+
+    if use_gallery:
+        matches = await face_gallery.search_async(q_emb, 1)
+    else:
+        matches = await FaceDao.nearest(q_emb, 1, session=session)
+    if not matches or matches[0][1] > THRESHOLD_DEFAULT:
+        raise NoVerificationExc
+    user_id, dist = matches[0]
+    return {"user_id": user_id, "distance": dist}
+
+
 @router.post("/verify-pin", response_model=TokenInfo)
 async def verify_pin_and_issue_tokens(
     response: Response,
     user_id: int = Form(...),
     pin: str = Form(...),
+    session: AsyncSession = request_session,
 ):
-    row = await FaceDao.get_by_id(user_id)
+    row, pin_obj = await FaceDao.get_with_pin(user_id, with_hash=True, session=session)
     if row is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Эмбеддинг для пользователя не найден")
 
-    emb_id = row[0]
-    pin_obj = await FacePinDao.get_by_emb_id(emb_id)
     if not pin_obj:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="PIN не найден")
 
-    if not FacePinDao.verify_pin(pin_obj.hashed_pin, pin):
+    if not await FacePinDao.verify_pin(pin_obj.hashed_pin, pin):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Неверный PIN")
 
 
@@ -154,15 +229,16 @@ async def verify_pin_and_issue_tokens(
 
 
 @router.delete("/delete")
-async def delete_face(current_user = Depends(get_current_user_to_access)):
+async def delete_face(current_user = Depends(get_current_user_to_access), session: AsyncSession = request_session):
     user_id = current_user.id
     if user_id is None:
         raise NoGivenToken
 
-    deleted = await FaceDao.delete(user_id)
+    deleted = await FaceDao.delete(user_id, session=session)
 
     if deleted is False:
         raise NoEmbForUser
+    await FaceDao.after_commit(session, lambda: face_gallery.remove_async(user_id))
     return {"deleted": True}
 
 
@@ -172,67 +248,75 @@ async def add_face_for_current_user(
     meta: str | None = Form(None),
     model = Depends(get_model),
     current_user = Depends(get_current_user_to_access),
+    session: AsyncSession = request_session,
+    deadline: float | None = Depends(request_deadline),
 ):
     user_id = current_user.id
     if user_id is None:
         raise NoGivenToken
 
-    if file.content_type.split("/")[0] != "image":
-        raise InvalidImg
-
-    content = await file.read()
-    if not content:
-        raise EmptyFile
-    if len(content) > MAX_FILE_SIZE:
-        raise FileTooLarge
-
+    emb = await query_embedding(model, file, inference_gates.get("put"), deadline)
     try:
-        pil = Image.open(io.BytesIO(content)).convert("RGB")
+        emb_id, obj = await FaceDao.create_or_update(user_id=user_id, emb=emb, meta=meta, session=session)
     except Exception:
-        raise NoOpenImg
+        raise CantSaveEmb
+    await FaceDao.after_commit(session, lambda: face_gallery.upsert_async(user_id, emb))
 
-    try:
-        emb = await compute_embedding_async(model, pil, transform=eval_transform)
-    except Exception as exc:
-        HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Ошбика вычисления эмбеддинга: {exc}")
+    return {"ok": True, "embedding_id": emb_id}
 
-    emb = np.asarray(emb, dtype="float32").reshape(-1)
-    if emb.size == 0 or not np.isfinite(emb).all():
-        raise InvalidEmb
 
+@router.post("/templates")
+async def add_face_template(
+    file: UploadFile = File(...),
+    slot: int | None = Form(None),
+    meta: str | None = Form(None),
+    model = Depends(get_model),
+    current_user = Depends(get_current_user_to_access),
+    session: AsyncSession = request_session,
+    deadline: float | None = Depends(request_deadline),
+):
+    """Without `slot` the template goes to the first free slot, with it that slot is replaced."""
+    user_id = current_user.id
+    if slot is not None and not 0 <= slot < settings.MAX_TEMPLATES:
+        raise InvalidTemplateSlot
+    emb = await query_embedding(model, file, inference_gates.get("templates"), deadline)
     try:
-        emb_id, obj = await FaceDao.create_or_update(user_id=user_id, emb=emb, meta=meta)
+        if slot is None:
+            written = await FaceDao.add_template(user_id=user_id, emb=emb, meta=meta, session=session)
+        else:
+            written = (await FaceDao.create_or_update(user_id=user_id, emb=emb, meta=meta, slot=slot, session=session))[0], slot
     except Exception:
         raise CantSaveEmb
-
-    return {"ok": True, "embedding_id": emb_id}
+    if written is None:
+        raise TooManyTemplates
+    emb_id, slot = written
+    await FaceDao.after_commit(session, lambda: face_gallery.upsert_async(user_id, emb, slot))
+    return {"ok": True, "embedding_id": emb_id, "slot": slot}
 
 
 @router.get('/pin')
-async def get_pin(current_user = Depends(get_current_user_to_access)):
+async def get_pin(current_user = Depends(get_current_user_to_access), session: AsyncSession = request_session):
     user_id = current_user.id
     if user_id is None:
         raise NoGivenToken
-    row = await FaceDao.get_by_id(user_id)
+    row, pin = await FaceDao.get_with_pin(user_id, session=session)
     if not row:
         raise NoEmbForUser
-    emb_id = row[0]
-    pin = await FacePinDao.get_by_emb_id(emb_id)
     if not pin:
         return {"has_pin": False, "pin_id": None}
     return {"has_pin": True, "pin_id": pin.id}
 
 @router.post("/pin/create")
-async def create_pin(pin: str = Form(...), current_user = Depends(get_current_user_to_access)):
+async def create_pin(pin: str = Form(...), current_user = Depends(get_current_user_to_access), session: AsyncSession = request_session):
     user_id = current_user.id
     if user_id is None:
         raise NoGivenToken
-    row = await FaceDao.get_by_id(user_id)
+    row = await FaceDao.get_by_id(user_id, session=session)
 
     if not row:
         raise NoEmbForUser
     emb_id = row[0]
-    new_obj = await FacePinDao.add_one(emb_id=emb_id, pin=pin)
+    new_obj = await FacePinDao.add_one(emb_id=emb_id, pin=pin, session=session)
     if not new_obj:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                                         detail="PIN уже существует")
@@ -240,18 +324,16 @@ async def create_pin(pin: str = Form(...), current_user = Depends(get_current_us
 
 
 @router.delete("/pin")
-async def delete_pin(current_user = Depends(get_current_user_to_access)):
+async def delete_pin(current_user = Depends(get_current_user_to_access), session: AsyncSession = request_session):
     user_id = current_user.id
     if user_id is None:
         raise NoGivenToken
-    row = await FaceDao.get_by_id(user_id)
+    row, pin_obj = await FaceDao.get_with_pin(user_id, session=session)
     if not row:
         raise NoEmbForUser
-    emb_id = row[0]
-    pin_obj = await FacePinDao.get_by_emb_id(emb_id)
     if not pin_obj:
         raise NoEmbForUser
-    deleted = await FacePinDao.delete_by_id(pin_obj.id)
+    deleted = await FacePinDao.delete_by_id(pin_obj.id, session=session)
     if not deleted:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                                         detail="Не удалось удалить PIN")
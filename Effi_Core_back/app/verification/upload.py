@@ -0,0 +1,110 @@
+from fastapi import UploadFile
+from fastapi.responses import JSONResponse
+
+from app.config import settings
+from app.exceptions import EmptyFile, FileTooLarge, InvalidImg
+from app.metrics import timed
+
+MAX_FILE_SIZE = settings.get_max_file_size()
+CHUNK_SIZE = 256 * 1024
+SNIFF_BYTES = 12
+
+SIGNATURES = (
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"GIF87a", "GIF"),
+    (b"GIF89a", "GIF"),
+    (b"BM", "BMP"),
+    (b"II*\x00", "TIFF"),
+    (b"MM\x00*", "TIFF"),
+)
+
+
+def image_format(head) -> str | None:
+    """Format named by the first bytes of an image file, None if they are not an image header."""
+    head = bytes(head[:SNIFF_BYTES])
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    for magic, name in SIGNATURES:
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def _feed(buf: bytearray, chunk: bytes, limit: int):
+    if len(buf) + len(chunk) > limit:
+        raise FileTooLarge
+    sniffed = len(buf) >= SNIFF_BYTES
+    buf += chunk
+    if not sniffed and len(buf) >= SNIFF_BYTES and image_format(buf) is None:
+        raise InvalidImg
+
+
+def _finish(buf: bytearray) -> memoryview:
+    if not buf:
+        raise EmptyFile
+    if image_format(buf) is None:
+        raise InvalidImg
+    return memoryview(buf)
+
+
+def read_limited(fp, limit: int = MAX_FILE_SIZE) -> memoryview:
+    """Reads a binary file object in CHUNK_SIZE pieces, stopping as soon as it grows past
+    `limit` (FileTooLarge) or its first bytes are not an image header (InvalidImg)."""
+    buf = bytearray()
+    while chunk := fp.read(CHUNK_SIZE):
+        _feed(buf, chunk, limit)
+    return _finish(buf)
+
+
+async def read_upload(file: UploadFile, limit: int = MAX_FILE_SIZE) -> memoryview:
+    """read_limited for an UploadFile, also checking the declared content type and size first.
+    The returned view is what the decoder and the embedding cache read, without copies."""
+    if (file.content_type or "").split("/")[0] != "image":
+        raise InvalidImg
+    if file.size is not None and file.size > limit:
+        raise FileTooLarge
+    with timed("upload_read"):
+        buf = bytearray()
+        while chunk := await file.read(CHUNK_SIZE):
+            _feed(buf, chunk, limit)
+        return _finish(buf)
+
+
+class BodySizeLimitMiddleware:
+    """Rejects request bodies over the limit for their path while they arrive: from
+    Content-Length before anything is read, otherwise once the streamed bytes cross it.
+    `limits` maps path prefixes to byte limits, the longest matching prefix wins."""
+
+    def __init__(self, app, default: int, limits: dict[str, int] | None = None):
+        self.app = app
+        self.default = default
+        self.limits = sorted((limits or {}).items(), key=lambda item: -len(item[0]))
+
+    def limit_for(self, path: str) -> int:
+        for prefix, limit in self.limits:
+            if path.startswith(prefix):
+                return limit
+        return self.default
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        limit = self.limit_for(scope["path"])
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > limit:
+            response = JSONResponse(status_code=FileTooLarge.status_code, content={"detail": FileTooLarge.detail})
+            return await response(scope, receive, send)
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised inside the body parser; FastAPI re-raises HTTPException, so it becomes a 413.
+                    raise FileTooLarge
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,35 @@
+import numpy as np
+from sqlalchemy import Float
+from sqlalchemy.types import UserDefinedType
+
+
+def to_vector_literal(emb) -> str:
+    return "[" + ",".join(map(repr, np.asarray(emb, dtype=np.float32).reshape(-1).tolist())) + "]"
+
+
+class Vector(UserDefinedType):
+    """pgvector `vector(dim)` column. Values go over the wire in the text format,
+    so asyncpg needs no extra codec and the pgvector python package is not required."""
+
+    cache_ok = True
+    render_bind_cast = True
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def get_col_spec(self, **kw):
+        return f"vector({self.dim})"
+
+    def bind_processor(self, dialect):
+        def process(value):
+            return None if value is None else to_vector_literal(value)
+        return process
+
+    def result_processor(self, dialect, coltype):
+        def process(value):
+            return None if value is None else np.array(value[1:-1].split(","), dtype=np.float32)
+        return process
+
+    class comparator_factory(UserDefinedType.Comparator):
+        def l2_distance(self, other):
+            return self.op("<->", return_type=Float)(other)
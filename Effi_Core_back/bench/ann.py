@@ -0,0 +1,69 @@
+"""Recall and throughput of the IVF-PQ gallery index vs exact brute-force search.
+
+    python -m bench.ann [--sizes 10000,100000,1000000] [--nprobe 4,16,64] [--k 5]
+
+Synthetic L2-normalized embeddings clustered around random identities; queries
+are noisy copies of gallery rows, like a second photo of an enrolled face.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.config import settings
+from app.verification.gallery import FaceGallery
+
+
+def synthetic_gallery(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 100), dim)).astype(np.float32)
+    x = centers[rng.integers(0, len(centers), n)] + 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def synthetic_queries(gallery: np.ndarray, n: int, noise: float, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    q = gallery[rng.integers(0, len(gallery), n)] + noise * rng.standard_normal((n, gallery.shape[1])).astype(np.float32)
+    return q / np.linalg.norm(q, axis=1, keepdims=True)
+
+
+def run_queries(gallery: FaceGallery, queries: np.ndarray, k: int) -> tuple[list[set], float]:
+    t0 = time.perf_counter()
+    results = [{uid for uid, _ in gallery.search(q, k)} for q in queries]
+    return results, len(queries) / (time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,100000")
+    parser.add_argument("--nprobe", default="4,16,64")
+    parser.add_argument("--dim", type=int, default=settings.EMBED_DIM)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=0.05)
+    args = parser.parse_args()
+
+    print(f"dim={args.dim} k={args.k} queries={args.queries} m={settings.ANN_M} refine=x{settings.ANN_REFINE}")
+    for n in (int(s) for s in args.sizes.split(",")):
+        x = synthetic_gallery(n, args.dim)
+        ids = np.arange(1, n + 1, dtype=np.int64)
+        queries = synthetic_queries(x, args.queries, args.noise)
+
+        exact = FaceGallery(dim=args.dim, ann_min_size=0)
+        exact.load(ids, x)
+        truth, exact_qps = run_queries(exact, queries, args.k)
+        print(f"\nN={n}: exact {exact_qps:.0f} qps")
+
+        approx = FaceGallery(dim=args.dim, ann_min_size=1)
+        t0 = time.perf_counter()
+        approx.load(ids, x)
+        print(f"  index build {time.perf_counter() - t0:.1f}s, nlist={approx.index.nlist}")
+        for nprobe in (int(p) for p in args.nprobe.split(",")):
+            approx.index.nprobe = nprobe
+            found, qps = run_queries(approx, queries, args.k)
+            recall = np.mean([len(f & t) / len(t) for f, t in zip(found, truth)])
+            print(f"  nprobe={nprobe:<4} recall@{args.k}={recall:.3f}  {qps:.0f} qps  (x{qps / exact_qps:.1f})")
+
+
+if __name__ == "__main__":
+    main()
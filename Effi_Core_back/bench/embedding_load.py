@@ -0,0 +1,61 @@
+"""Full-table embedding load: ORM get_all_embeddings vs the binary COPY loader.
+
+    python -m bench.embedding_load [--limit N] [--skip-orm]
+
+Reports rows/s and the peak Python heap (tracemalloc) of each path.
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+import numpy as np
+
+from app.config import settings
+from app.database import engine
+from app.verification.dao import FaceDao
+
+
+async def orm(limit):
+    rows = await FaceDao.get_all_embeddings(limit=limit)
+    rows = [(user_id, emb) for _, user_id, emb in rows if emb.shape[0] == settings.EMBED_DIM]
+    user_ids = np.array([user_id for user_id, _ in rows], dtype=np.int64)
+    matrix = np.stack([emb for _, emb in rows]) if rows else np.zeros((0, settings.EMBED_DIM), dtype=np.float32)
+    return user_ids, matrix
+
+
+async def copy(limit):
+    user_ids, _, matrix = await FaceDao.load_embeddings(settings.EMBED_DIM, limit=limit)
+    return user_ids, matrix
+
+
+async def run(args):
+    paths = (copy,) if args.skip_orm else (orm, copy)
+    results = {}
+    for fn in paths:
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        user_ids, matrix = await fn(args.limit)
+        elapsed = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[fn.__name__] = (user_ids, matrix)
+        print(f"{fn.__name__:>5}: {len(user_ids)} rows in {elapsed:.2f}s  {len(user_ids) / max(elapsed, 1e-9):.0f} rows/s  "
+              f"peak heap {peak / 2**20:.1f} MiB (data {matrix.nbytes / 2**20:.1f} MiB)")
+    if len(results) == 2:
+        # The COPY loader orders rows by id within each stored format only; a user can have several templates.
+        order = [np.lexsort((m[:, 0], ids)) if len(ids) else np.arange(0) for ids, m in results.values()]
+        (a_ids, a), (b_ids, b) = ((ids[o], m[o]) for (ids, m), o in zip(results.values(), order))
+        print(f"identical: {np.array_equal(a_ids, b_ids) and np.array_equal(a, b, equal_nan=True)}")
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--skip-orm", action="store_true")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
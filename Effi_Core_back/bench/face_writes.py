@@ -0,0 +1,169 @@
+"""Face write paths: the previous ORM load-modify-commit-refresh statements vs
+single INSERT ... ON CONFLICT / DELETE ... RETURNING statements.
+
+    python -m bench.face_writes [--requests 200]
+
+Creates a temporary user, runs each write repeatedly through both variants and
+reports SQL statements and commits per call plus latency. The user is removed at the end.
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+import numpy as np
+from sqlalchemy import delete, event, insert, select
+
+from app.config import settings
+from app.database import async_session, engine
+from app.user.auth import JwtController
+from app.user.models import Users
+from app.verification.dao import FaceDao, FacePinDao
+from app.verification.models import FaceEmbedding, FacePin
+
+counts = {"statements": 0, "commits": 0}
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _count_statement(*_):
+    counts["statements"] += 1
+
+
+@event.listens_for(engine.sync_engine, "commit")
+def _count_commit(*_):
+    counts["commits"] += 1
+
+
+async def old_create(user_id, emb):
+    async with async_session() as session:
+        obj = FaceEmbedding(user_id=user_id, **FaceDao._emb_values(emb))
+        session.add(obj)
+        await session.commit()
+        await session.refresh(obj)
+        return obj.id
+
+
+async def old_put(user_id, emb):
+    async with async_session() as session:
+        q = await session.execute(select(FaceEmbedding).where(FaceEmbedding.user_id == user_id))
+        obj = q.scalars().one_or_none()
+        if obj:
+            for key, value in FaceDao._emb_values(emb).items():
+                setattr(obj, key, value)
+        else:
+            obj = FaceEmbedding(user_id=user_id, **FaceDao._emb_values(emb))
+        session.add(obj)
+        await session.commit()
+        await session.refresh(obj)
+        return obj.id
+
+
+async def old_delete(user_id):
+    async with async_session() as session:
+        q = await session.execute(select(FaceEmbedding).where(FaceEmbedding.user_id == user_id))
+        obj = q.scalars().one_or_none()
+        if not obj:
+            return False
+        await session.delete(obj)
+        await session.commit()
+        return True
+
+
+async def old_pin_add(emb_id, pin):
+    hashed = JwtController.get_password_hash(password=pin)
+    async with async_session() as session:
+        obj = FacePin(emb_id=emb_id, hashed_pin=hashed)
+        session.add(obj)
+        await session.commit()
+        await session.refresh(obj)
+        return obj.id
+
+
+async def new_create(user_id, emb):
+    return (await FaceDao.add_one(user_id=user_id, emb=emb)).id
+
+
+async def new_put(user_id, emb):
+    return (await FaceDao.create_or_update(user_id=user_id, emb=emb))[0]
+
+
+async def new_delete(user_id):
+    return await FaceDao.delete(user_id)
+
+
+async def new_pin_add(emb_id, pin):
+    return (await FacePinDao.add_one(emb_id=emb_id, pin=pin)).id
+
+
+class Timer:
+    def __init__(self):
+        self.latencies = []
+        self.statements = 0
+        self.commits = 0
+
+    async def run(self, coro):
+        before = dict(counts)
+        t0 = time.perf_counter()
+        result = await coro
+        self.latencies.append((time.perf_counter() - t0) * 1000)
+        self.statements += counts["statements"] - before["statements"]
+        self.commits += counts["commits"] - before["commits"]
+        return result
+
+    def report(self, name):
+        lat = np.array(self.latencies)
+        n = len(lat)
+        print(f"{name:>16}: {self.statements / n:.1f} stmts  {self.commits / n:.1f} commits  "
+              f"p50={np.percentile(lat, 50):.2f}ms  p99={np.percentile(lat, 99):.2f}ms")
+
+
+async def cycle(variant, timers, user_id, emb, new_emb):
+    create, put, remove, pin_add = variant
+    emb_id = await timers["create"].run(create(user_id, emb))
+    await timers["put"].run(put(user_id, new_emb))
+    # bcrypt dominates the PIN write either way; the point is the statement count.
+    pin_id = await timers["pin add"].run(pin_add(emb_id, "1234"))
+    await FacePinDao.delete_by_id(pin_id)
+    await timers["delete"].run(remove(user_id))
+
+
+async def run(args):
+    rng = np.random.default_rng(0)
+    emb, new_emb = rng.standard_normal((2, settings.EMBED_DIM)).astype(np.float32)
+    async with async_session() as session:
+        q = await session.execute(insert(Users).values(
+            login="bench", first_name="bench", last_name="bench",
+            email=f"b{uuid.uuid4().hex[:12]}@bench.io", hashed_password="", email_confirmed=True,
+        ).returning(Users.id))
+        user_id = q.scalar_one()
+        await session.commit()
+    variants = {
+        "old": (old_create, old_put, old_delete, old_pin_add),
+        "new": (new_create, new_put, new_delete, new_pin_add),
+    }
+    try:
+        for variant in variants.values():
+            await cycle(variant, {op: Timer() for op in ("create", "put", "pin add", "delete")}, user_id, emb, new_emb)
+        print(f"requests={args.requests}")
+        for name, variant in variants.items():
+            timers = {op: Timer() for op in ("create", "put", "pin add", "delete")}
+            for _ in range(args.requests):
+                await cycle(variant, timers, user_id, emb, new_emb)
+            for op, timer in timers.items():
+                timer.report(f"{name} {op}")
+    finally:
+        async with async_session() as session:
+            await FaceDao.delete(user_id, session=session)
+            await session.execute(delete(Users).where(Users.id == user_id))
+            await session.commit()
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Per-request cost of turning a bearer token into a payload: full jwt.decode vs the token cache.
+
+    python -m bench.jwt_decode [--tokens 1000] [--requests 200000]
+
+`--tokens` distinct access tokens are issued up front; `--requests` lookups pick among them
+at random, as many clients repeating their own token would. Reports microseconds per
+request for decode only and for get_payload's cache-then-decode path, plus the hit ratio.
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from app.user.auth import JwtController
+from app.user.dependencies import get_payload
+from app.user.token_cache import TokenCache, token_cache
+
+
+def per_request_us(fn, tokens: list[str], order: np.ndarray) -> float:
+    t0 = time.perf_counter()
+    for i in order:
+        fn(tokens[i])
+    return (time.perf_counter() - t0) / len(order) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=200000)
+    args = parser.parse_args()
+
+    tokens = [JwtController.create_token({"sub": str(i)}, token_type="access") for i in range(args.tokens)]
+    order = np.random.default_rng(0).integers(0, args.tokens, args.requests)
+
+    decode_us = per_request_us(JwtController.decode_jwt, tokens, order)
+
+    cache = TokenCache(token_cache.max_entries)
+
+    def cached(token):
+        payload = cache.get(token)
+        if payload is None:
+            payload = JwtController.decode_jwt(token)
+            cache.put(token, payload)
+        return payload
+
+    cached_us = per_request_us(cached, tokens, order)
+
+    async def through_dependency():
+        # The same path through the FastAPI dependency, coroutine overhead included.
+        token_cache.clear()
+        t0 = time.perf_counter()
+        for i in order:
+            await get_payload(tokens[i])
+        return (time.perf_counter() - t0) / len(order) * 1e6
+
+    dependency_us = asyncio.run(through_dependency())
+
+    stats = cache.stats()
+    print(f"tokens={args.tokens} requests={args.requests}")
+    print(f"  decode:      {decode_us:7.2f} us/request")
+    print(f"  cached:      {cached_us:7.2f} us/request  hit_ratio={stats['hit_ratio']:.3f} entries={stats['entries']}")
+    print(f"  get_payload: {dependency_us:7.2f} us/request  hit_ratio={token_cache.stats()['hit_ratio']:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+"""End-to-end load test of the API: a mix of /auth/login, /face/verify, /face/put and /face/status
+driven by an asyncio client, with throughput and p50/p95/p99 per endpoint saved as JSON.
+
+    python -m bench.load [--duration 60] [--concurrency 16] [--users 20]
+                         [--mix verify:6,status:2,login:1,put:1] [--workers 1]
+                         [--output load.json] [--baseline previous.json] [--url http://host:port]
+
+Runs against the Postgres and Redis from the settings (.env). Unless `--url` is given, `app.main:app`
+is started with uvicorn in a separate process; if MODEL_WEIGHTS_PATH does not exist, a randomly
+initialized EmbeddingNet is saved to a temporary file and served instead, so the forward pass costs
+the same as with real weights. `--users` confirmed users are created with synthetic face images,
+logged in and enrolled through /face/put before the measurement, and removed at the end.
+
+Every upload is a new photo of the user (shifted, lit and noised differently) with unique bytes,
+so the embedding cache misses as it does in production. Latency percentiles are over 2xx
+responses; other statuses are counted per endpoint. `--baseline` prints the change against a
+report saved by an earlier run, e.g. on the previous commit.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+
+import httpx
+import numpy as np
+from PIL import Image, ImageDraw
+from sqlalchemy import delete, insert
+
+from app.config import settings
+from app.database import async_session, engine
+from app.user.auth import JwtController
+from app.user.models import Users
+from app.verification.models import FaceEmbedding
+
+PASSWORD = "load-password"
+ENDPOINTS = ("login", "verify", "put", "status")
+PHOTO_SIZE = (480, 640)
+VARIANTS = 8
+
+
+def synthetic_face(rng: np.random.Generator, size=PHOTO_SIZE) -> np.ndarray:
+    """A cartoon face (head, hair, eyes, brows, nose, mouth) whose proportions and colours depend on `rng`."""
+    w, h = size
+    img = Image.new("RGB", size, tuple(int(c) for c in rng.integers(40, 220, 3)))
+    d = ImageDraw.Draw(img)
+    skin = tuple(int(c) for c in rng.integers((150, 100, 70), (255, 220, 190)))
+    dark = tuple(int(c) for c in rng.integers(0, 90, 3))
+    cx, cy = w / 2 + rng.normal(0, w * 0.02), h / 2 + rng.normal(0, h * 0.02)
+    fw, fh = w * rng.uniform(0.26, 0.34), h * rng.uniform(0.30, 0.37)
+    d.ellipse((cx - fw - 8, cy - fh - 20, cx + fw + 8, cy + fh * 0.2), fill=dark)
+    d.ellipse((cx - fw, cy - fh, cx + fw, cy + fh), fill=skin)
+    ex, ey, er = fw * rng.uniform(0.35, 0.5), cy - fh * rng.uniform(0.15, 0.3), fw * rng.uniform(0.09, 0.14)
+    for sx in (-1, 1):
+        x = cx + sx * ex
+        d.ellipse((x - er * 1.6, ey - er, x + er * 1.6, ey + er), fill=(245, 245, 245))
+        d.ellipse((x - er * 0.7, ey - er * 0.7, x + er * 0.7, ey + er * 0.7), fill=dark)
+        d.line((x - er * 1.8, ey - er * 2.2, x + er * 1.8, ey - er * 2.6), fill=dark, width=max(2, int(er / 2)))
+    nose = fh * rng.uniform(0.15, 0.25)
+    d.polygon(((cx, ey + er), (cx - nose * 0.4, ey + er + nose), (cx + nose * 0.4, ey + er + nose)),
+              fill=tuple(max(0, c - 40) for c in skin))
+    my, mw = cy + fh * rng.uniform(0.4, 0.55), fw * rng.uniform(0.3, 0.5)
+    d.chord((cx - mw, my - mw * 0.4, cx + mw, my + mw * 0.4), 0, 180, fill=(150, 40, 50))
+    return np.asarray(img)
+
+
+def photo(face: np.ndarray, rng: np.random.Generator) -> bytes:
+    """Another JPEG shot of `face`: slightly shifted, brighter or darker, with sensor noise."""
+    shifted = np.roll(face, tuple(rng.integers(-6, 7, 2)), axis=(0, 1)).astype(np.float32)
+    shifted = shifted * rng.uniform(0.9, 1.1) + rng.normal(0, 4, face.shape)
+    buf = io.BytesIO()
+    Image.fromarray(shifted.clip(0, 255).astype(np.uint8)).save(buf, format="JPEG", quality=int(rng.integers(80, 95)))
+    return buf.getvalue()
+
+
+def unique(content: bytes) -> bytes:
+    # Decoders stop at the JPEG end marker, but the bytes (and so the embedding cache key) differ.
+    return content + os.urandom(16)
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition(":")
+        if name.strip() not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"unknown endpoint {name!r}, expected one of {ENDPOINTS}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def random_weights() -> str:
+    """Saves a randomly initialized model in the format load_model reads and returns its path."""
+    import torch
+
+    from app.verification.model_impl import EmbeddingNet, SiameseNet
+
+    torch.manual_seed(0)
+    model = SiameseNet(EmbeddingNet(embedding_dim=settings.EMBED_DIM, pretrained=False))
+    fd, path = tempfile.mkstemp(suffix=".pth", prefix="efficore-random-")
+    os.close(fd)
+    torch.save({"model_state_dict": model.state_dict()}, path)
+    return path
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, env: dict) -> tuple[subprocess.Popen, str]:
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"server exited with code {server.returncode}")
+        try:
+            if httpx.get(f"{url}/health/ready", timeout=1).status_code == 200:
+                return server, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError(f"server not ready after {args.startup_timeout}s")
+
+
+class User:
+    def __init__(self, user_id: int, email: str, face: np.ndarray, rng: np.random.Generator):
+        self.id = user_id
+        self.email = email
+        self.photos = [photo(face, rng) for _ in range(VARIANTS)]
+        self.token = None
+
+    @property
+    def auth(self) -> dict:
+        return {"Authorization": f"Bearer {self.token}"}
+
+
+async def create_users(count: int, seed: int) -> list[User]:
+    hashed = JwtController.get_password_hash(PASSWORD)
+    run_id = uuid.uuid4().hex[:8]
+    users = []
+    async with async_session() as session:
+        for i in range(count):
+            email = f"load{run_id}-{i}@bench.io"
+            q = await session.execute(insert(Users).values(
+                login="load", first_name="load", last_name="load",
+                email=email, hashed_password=hashed, email_confirmed=True,
+            ).returning(Users.id))
+            rng = np.random.default_rng(seed + i)
+            users.append(User(q.scalar_one(), email, synthetic_face(rng), rng))
+        await session.commit()
+    return users
+
+
+async def remove_users(users: list[User]):
+    ids = [u.id for u in users]
+    async with async_session() as session:
+        await session.execute(delete(FaceEmbedding).where(FaceEmbedding.user_id.in_(ids)))
+        await session.execute(delete(Users).where(Users.id.in_(ids)))
+        await session.commit()
+    await engine.dispose()
+
+
+def upload(content: bytes) -> dict:
+    return {"file": ("photo.jpg", unique(content), "image/jpeg")}
+
+
+async def call(client: httpx.AsyncClient, endpoint: str, user: User, rnd: random.Random) -> httpx.Response:
+    if endpoint == "login":
+        r = await client.post("/auth/login", json={"email": user.email, "password": PASSWORD})
+        if r.status_code == 200:
+            user.token = r.json()["efficore_token"]
+        return r
+    if endpoint == "verify":
+        return await client.post("/face/verify", data={"email": user.email}, files=upload(rnd.choice(user.photos)))
+    if endpoint == "put":
+        return await client.put("/face/put", headers=user.auth, files=upload(rnd.choice(user.photos)))
+    return await client.get("/face/status", headers=user.auth)
+
+
+async def prepare(client: httpx.AsyncClient, users: list[User]):
+    rnd = random.Random(0)
+    for user in users:
+        for endpoint in ("login", "put"):
+            r = await call(client, endpoint, user, rnd)
+            if r.status_code != 200:
+                raise RuntimeError(f"{endpoint} for {user.email} failed during setup: {r.status_code} {r.text}")
+
+
+async def drive(client: httpx.AsyncClient, users: list[User], args) -> tuple[dict, float]:
+    names, weights = zip(*args.mix.items())
+    results = {name: {"latencies": [], "statuses": {}} for name in names}
+    stop = time.perf_counter() + args.duration
+
+    async def worker(n: int):
+        rnd = random.Random(args.seed * 1000 + n)
+        while time.perf_counter() < stop:
+            endpoint = rnd.choices(names, weights)[0]
+            t0 = time.perf_counter()
+            try:
+                status = str((await call(client, endpoint, rnd.choice(users), rnd)).status_code)
+            except httpx.HTTPError as exc:
+                status = type(exc).__name__
+            result = results[endpoint]
+            result["statuses"][status] = result["statuses"].get(status, 0) + 1
+            if status.startswith("2"):
+                result["latencies"].append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(args.concurrency)))
+    return results, time.perf_counter() - t0
+
+
+def summarize(latencies: list[float], statuses: dict, elapsed: float) -> dict:
+    lat = np.array(latencies or [np.nan])
+    return {
+        "requests": sum(statuses.values()),
+        "ok": len(latencies),
+        "statuses": dict(sorted(statuses.items())),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        **{f"p{q}_ms": round(float(np.percentile(lat, q)), 2) for q in (50, 95, 99)},
+        "max_ms": round(float(lat.max()), 2),
+    }
+
+
+def git_revision() -> dict:
+    def git(*cmd):
+        return subprocess.run(["git", *cmd], capture_output=True, text=True).stdout.strip()
+    return {"commit": git("rev-parse", "HEAD") or None, "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def report(results: dict, elapsed: float, args, random_model: bool) -> dict:
+    endpoints = {name: summarize(r["latencies"], r["statuses"], elapsed) for name, r in results.items()}
+    statuses = {}
+    for r in results.values():
+        for status, count in r["statuses"].items():
+            statuses[status] = statuses.get(status, 0) + count
+    total = summarize([x for r in results.values() for x in r["latencies"]], statuses, elapsed)
+    return {
+        **git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "host": {"cpus": os.cpu_count(), "python": platform.python_version(), "platform": platform.platform()},
+        "config": {
+            "duration_s": args.duration, "concurrency": args.concurrency, "users": args.users, "mix": args.mix,
+            "seed": args.seed, "workers": None if args.url else args.workers, "url": args.url,
+            "model_engine": settings.MODEL_ENGINE, "random_weights": random_model,
+        },
+        "elapsed_s": round(elapsed, 2),
+        "endpoints": endpoints,
+        "total": total,
+    }
+
+
+def endpoint_stats(data: dict, name: str) -> dict:
+    return data["total"] if name == "total" else data["endpoints"].get(name, {})
+
+
+def print_report(data: dict, baseline: dict | None):
+    def value(name, key, unit=""):
+        new = endpoint_stats(data, name)[key]
+        old = endpoint_stats(baseline, name).get(key) if baseline else None
+        return f"{new:.1f}{unit}" if not old else f"{new:.1f}{unit} ({(new - old) / old:+.1%})"
+
+    print(f"commit={data['commit']}{' (dirty)' if data['dirty'] else ''} elapsed={data['elapsed_s']}s")
+    if baseline:
+        print(f"baseline commit={baseline['commit']} from {baseline['timestamp']}")
+    for name in (*data["endpoints"], "total"):
+        print(f"{name:>7}: rps={value(name, 'throughput_rps')} p50={value(name, 'p50_ms', 'ms')} "
+              f"p95={value(name, 'p95_ms', 'ms')} p99={value(name, 'p99_ms', 'ms')}  {endpoint_stats(data, name)['statuses']}")
+
+
+async def run(args, url: str, random_model: bool):
+    users = await create_users(args.users, args.seed)
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+            await prepare(client, users)
+            results, elapsed = await drive(client, users, args)
+    finally:
+        await remove_users(users)
+    return report(results, elapsed, args, random_model)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("verify:6,status:2,login:1,put:1"))
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    parser.add_argument("--url", help="measure an already running server instead of starting one")
+    parser.add_argument("--output", default="load.json")
+    parser.add_argument("--baseline", help="report of an earlier run to compare against")
+    args = parser.parse_args()
+
+    env, weights, server, url = dict(os.environ), None, None, args.url
+    if not url and settings.MODEL_ENGINE == "eager" and not os.path.exists(settings.MODEL_WEIGHTS_PATH):
+        weights = env["MODEL_WEIGHTS_PATH"] = random_weights()
+    try:
+        if not url:
+            server, url = start_server(args, env)
+        data = asyncio.run(run(args, url, weights is not None))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if weights:
+            os.remove(weights)
+
+    with open(args.output, "w") as f:
+        json.dump(data, f, indent=2)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(data, baseline)
+    print(f"saved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
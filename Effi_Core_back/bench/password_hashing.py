@@ -0,0 +1,104 @@
+"""Login under concurrent load: bcrypt on the event loop (previous) vs the bounded hashing executor.
+
+    python -m bench.password_hashing [--requests 200] [--concurrency 16]
+
+Creates a temporary confirmed user, runs `--requests` logins (user lookup + password check)
+with `--concurrency` in flight through both variants, and reports login throughput and
+latency plus event-loop lag: how late a 5 ms timer running next to the logins fires.
+The user is removed at the end. Hash cost is BCRYPT_ROUNDS.
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+import numpy as np
+from sqlalchemy import delete, insert
+
+from app.config import settings
+from app.database import async_session, engine
+from app.user.auth import JwtController
+from app.user.dao import UserDao
+from app.user.hashing import hash_executor
+from app.user.models import Users
+from app.verification import models  # noqa: F401  registers FaceEmbedding for Users.embeddings
+
+PASSWORD = "bench-password"
+TICK_S = 0.005
+
+
+async def old_login(email):
+    user = await UserDao.get_by_filter_or_none(email=email)
+    return JwtController.verify_password(PASSWORD, user.hashed_password)
+
+
+async def new_login(email):
+    user = await UserDao.get_by_filter_or_none(email=email)
+    return await JwtController.authenticate_user(PASSWORD, user.hashed_password)
+
+
+async def probe_lag(lags: list, stop: asyncio.Event):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        t0 = loop.time()
+        await asyncio.sleep(TICK_S)
+        lags.append((loop.time() - t0 - TICK_S) * 1000)
+
+
+async def run_variant(login, email, args):
+    sem = asyncio.Semaphore(args.concurrency)
+    latencies, lags = [], []
+
+    async def one():
+        async with sem:
+            t0 = time.perf_counter()
+            assert await login(email)
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    stop = asyncio.Event()
+    probe = asyncio.create_task(probe_lag(lags, stop))
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(args.requests)))
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await probe
+    return elapsed, np.array(latencies), np.array(lags or [0.0])
+
+
+async def run(args):
+    hashed = JwtController.get_password_hash(PASSWORD)
+    email = f"b{uuid.uuid4().hex[:12]}@bench.io"
+    async with async_session() as session:
+        q = await session.execute(insert(Users).values(
+            login="bench", first_name="bench", last_name="bench",
+            email=email, hashed_password=hashed, email_confirmed=True,
+        ).returning(Users.id))
+        user_id = q.scalar_one()
+        await session.commit()
+    try:
+        for login in (old_login, new_login):
+            await login(email)
+        print(f"requests={args.requests} concurrency={args.concurrency} rounds={settings.BCRYPT_ROUNDS} "
+              f"workers={hash_executor.workers}")
+        for name, login in (("old", old_login), ("new", new_login)):
+            elapsed, lat, lag = await run_variant(login, email, args)
+            print(f"{name:>4}: {args.requests / elapsed:7.1f} logins/s  "
+                  f"latency p50={np.percentile(lat, 50):.1f}ms p99={np.percentile(lat, 99):.1f}ms  "
+                  f"loop lag p50={np.percentile(lag, 50):.1f}ms p99={np.percentile(lag, 99):.1f}ms max={lag.max():.1f}ms")
+    finally:
+        async with async_session() as session:
+            await session.execute(delete(Users).where(Users.id == user_id))
+            await session.commit()
+        hash_executor.shutdown()
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Per-stage timings of the torchvision eval_transform path vs the fused preprocess path.
+
+    python -m bench.preprocess [--images DIR] [--repeat 20]
+
+Without --images a synthetic 12 MP JPEG (typical phone photo) is used.
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+from app.verification.model_dlm import IMG_SIZE, eval_transform
+from app.verification.preprocess import decode_image, empty_input, normalize_into, resize_image
+
+
+def synthetic_jpeg(width: int = 4000, height: int = 3000) -> bytes:
+    rng = np.random.default_rng(0)
+    small = rng.integers(0, 255, (height // 50, width // 50, 3), dtype=np.uint8)
+    img = Image.fromarray(small).resize((width, height), Image.BILINEAR)
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def load_inputs(images_dir: str | None) -> list[bytes]:
+    if not images_dir:
+        return [synthetic_jpeg()]
+    inputs = []
+    for name in sorted(os.listdir(images_dir)):
+        with open(os.path.join(images_dir, name), "rb") as f:
+            inputs.append(f.read())
+    return inputs
+
+
+def timed(stages: dict, name: str, fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    stages[name] = stages.get(name, 0.0) + (time.perf_counter() - t0) * 1000
+    return out
+
+
+def baseline(content: bytes, stages: dict):
+    resize, to_tensor, normalize = eval_transform.transforms
+    pil = timed(stages, "decode", lambda: Image.open(io.BytesIO(content)).convert("RGB"))
+    pil = timed(stages, "resize", resize, pil)
+    x = timed(stages, "to_tensor", to_tensor, pil)
+    return timed(stages, "normalize", normalize, x)
+
+
+def fast(content: bytes, stages: dict):
+    out = empty_input()
+    img = timed(stages, "decode", decode_image, content)
+    img = timed(stages, "resize", resize_image, img)
+    return timed(stages, "normalize", normalize_into, img, out)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", default=None)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--atol", type=float, default=0.02, help="allowed mean abs diff in normalized units")
+    args = parser.parse_args()
+
+    inputs = load_inputs(args.images)
+    results = {}
+    for name, fn in (("eval_transform", baseline), ("fast", fast)):
+        stages = {}
+        for _ in range(args.repeat):
+            for content in inputs:
+                fn(content, stages)
+        n = args.repeat * len(inputs)
+        results[name] = {stage: ms / n for stage, ms in stages.items()}
+
+    diffs = [(fast(c, {}) - baseline(c, {})).abs() for c in inputs]
+    max_diff = max(float(d.max()) for d in diffs)
+    mean_diff = float(np.mean([float(d.mean()) for d in diffs]))
+
+    print(f"{len(inputs)} image(s), IMG_SIZE={IMG_SIZE}, repeat={args.repeat}")
+    for name, stages in results.items():
+        per_stage = "  ".join(f"{stage}={ms:.2f}ms" for stage, ms in stages.items())
+        print(f"{name:>15}: total={sum(stages.values()):.2f}ms  {per_stage}")
+    speedup = sum(results["eval_transform"].values()) / sum(results["fast"].values())
+    print(f"speedup: x{speedup:.1f}")
+    print(f"diff vs eval_transform: max={max_diff:.4f} mean={mean_diff:.4f} "
+          f"({'OK' if mean_diff <= args.atol else 'ABOVE TOLERANCE'})")
+    if mean_diff > args.atol:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
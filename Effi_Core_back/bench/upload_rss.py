@@ -0,0 +1,141 @@
+"""Server memory under a flood of oversized uploads: the previous `await file.read()` then size
+check vs read_upload behind BodySizeLimitMiddleware.
+
+    python -m bench.upload_rss [--uploads 64] [--concurrency 16] [--size-mb 50] [--chunked]
+
+Each variant is a one-route app (`old_app`, `new_app` below) served by its own uvicorn
+process, so only upload ingestion is measured. Uploads are a JPEG header followed by
+`--size-mb` of random bytes, streamed by the client; `--chunked` drops Content-Length so the
+limit has to be enforced on the stream. Reports the server's RSS before and its peak (VmHWM),
+Linux only.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+from fastapi import FastAPI, File, UploadFile
+
+from app.config import settings
+from app.exceptions import FileTooLarge, InvalidImg
+from app.verification.upload import MAX_FILE_SIZE, BodySizeLimitMiddleware, read_upload
+
+old_app = FastAPI()
+new_app = FastAPI()
+new_app.add_middleware(BodySizeLimitMiddleware, default=settings.get_max_request_size())
+
+
+@old_app.post("/upload")
+async def old_upload(file: UploadFile = File(...)):
+    if file.content_type.split("/")[0] != "image":
+        raise InvalidImg
+    content = await file.read()
+    if len(content) > MAX_FILE_SIZE:
+        raise FileTooLarge
+    return {"size": len(content)}
+
+
+@new_app.post("/upload")
+async def new_upload(file: UploadFile = File(...)):
+    content = await read_upload(file)
+    return {"size": len(content)}
+
+
+BOUNDARY = "benchboundary"
+CHUNK = os.urandom(1024 * 1024)
+
+
+def multipart_parts(size: int):
+    head = (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="f.jpg"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n').encode() + b"\xff\xd8\xff"
+    tail = f"\r\n--{BOUNDARY}--\r\n".encode()
+    return head, size, tail
+
+
+async def body(size: int):
+    head, size, tail = multipart_parts(size)
+    yield head
+    left = size
+    while left > 0:
+        yield CHUNK[:min(left, len(CHUNK))]
+        left -= len(CHUNK)
+    yield tail
+
+
+def memory_kb(pid: int) -> dict[str, int]:
+    with open(f"/proc/{pid}/status") as f:
+        return {k: int(v.split()[0]) for k, v in (line.split(":", 1) for line in f) if k in ("VmRSS", "VmHWM")}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def flood(url: str, args) -> dict[str, int]:
+    size = int(args.size_mb * 1024 * 1024)
+    head, _, tail = multipart_parts(size)
+    headers = {"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"}
+    if not args.chunked:
+        headers["Content-Length"] = str(len(head) + size + len(tail))
+    outcomes: dict[str, int] = {}
+    sem = asyncio.Semaphore(args.concurrency)
+    async with httpx.AsyncClient(timeout=120) as client:
+        async def one():
+            async with sem:
+                try:
+                    r = await client.post(url, content=body(size), headers=headers)
+                    key = str(r.status_code)
+                except httpx.HTTPError as exc:
+                    # The server answered and closed the connection while the body was still being sent.
+                    key = type(exc).__name__
+                outcomes[key] = outcomes.get(key, 0) + 1
+
+        await asyncio.gather(*(one() for _ in range(args.uploads)))
+    return outcomes
+
+
+def run_variant(name: str, args):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", f"bench.upload_rss:{name}_app", "--port", str(port), "--log-level", "warning"],
+    )
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(f"http://127.0.0.1:{port}/docs", timeout=1)
+                break
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        before = memory_kb(server.pid)
+        t0 = time.perf_counter()
+        outcomes = asyncio.run(flood(f"http://127.0.0.1:{port}/upload", args))
+        elapsed = time.perf_counter() - t0
+        after = memory_kb(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+    print(f"{name:>4}: rss before={before['VmRSS'] / 1024:.0f}MB peak={after['VmHWM'] / 1024:.0f}MB  "
+          f"{elapsed:.2f}s  {outcomes}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uploads", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--size-mb", type=float, default=50)
+    parser.add_argument("--chunked", action="store_true")
+    args = parser.parse_args()
+    print(f"uploads={args.uploads} concurrency={args.concurrency} size={args.size_mb}MB "
+          f"limit={MAX_FILE_SIZE / 2 ** 20:.0f}MB chunked={args.chunked}")
+    for name in ("old", "new"):
+        run_variant(name, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Latency of the /face/verify data path: three sequential database lookups after inference
+(the original path, never touching Redis) vs get_verify_data running concurrently with
+inference, which reads the templates through the Redis face cache as the endpoint does.
+
+    python -m bench.verify --email user@example.com [--requests 200] [--concurrency 1]
+
+The user must exist and have an enrolled embedding. The embedding cache is bypassed
+so every iteration runs a forward pass, as for a fresh photo.
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from sqlalchemy import select
+
+from app.database import async_session, engine
+from app.user.dao import UserDao
+from app.verification.codec import decode_embedding
+from app.verification.dao import FaceDao, FacePinDao
+from app.verification.matching import template_distance
+from app.verification.models import FaceEmbedding
+from app.verification.model_dlm import IMG_SIZE, get_model
+from app.verification.router import embed_content
+from bench.preprocess import synthetic_jpeg
+
+
+async def sequential(model, email: str, content: bytes):
+    user = await UserDao.get_by_filter_or_none(email=email)
+    emb = await embed_content(model, content)
+    # Straight from the database: FaceDao.get_by_id would be served by the face cache.
+    async with async_session() as session:
+        q = await session.execute(
+            select(FaceEmbedding.id, FaceEmbedding.embedding)
+            .where(FaceEmbedding.user_id == user.id, FaceEmbedding.slot == 0)
+        )
+        emb_id, stored = q.one()
+    pin = await FacePinDao.get_by_emb_id(emb_id)
+    return float(np.linalg.norm(decode_embedding(stored) - emb)), pin is not None
+
+
+async def joined(model, email: str, content: bytes):
+    row, emb = await asyncio.gather(FaceDao.get_verify_data(email), embed_content(model, content))
+    templates = np.stack([decode_embedding(t) for t in row.templates])
+    return template_distance(emb, templates), row.has_pin
+
+
+async def measure(fn, model, email: str, content: bytes, requests: int, concurrency: int) -> np.ndarray:
+    latencies = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            t0 = time.perf_counter()
+            await fn(model, email, content)
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return np.array(latencies)
+
+
+async def run(args):
+    model = get_model()
+    content = synthetic_jpeg(IMG_SIZE * 2, IMG_SIZE * 2)
+    if await FaceDao.get_verify_data(args.email) is None:
+        raise SystemExit(f"no user with email {args.email}")
+    for fn in (sequential, joined):
+        await measure(fn, model, args.email, content, min(args.requests, 20), args.concurrency)
+    print(f"requests={args.requests} concurrency={args.concurrency}")
+    for fn in (sequential, joined):
+        lat = await measure(fn, model, args.email, content, args.requests, args.concurrency)
+        print(f"{fn.__name__:>10}: p50={np.percentile(lat, 50):.2f}ms  p99={np.percentile(lat, 99):.2f}ms  "
+              f"mean={lat.mean():.2f}ms")
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""face_embeddings.embedding_vec - pgvector column
+
+Revision ID: 3b7e2f9a1c4d
+Revises: e61dd1a8c845
+Create Date: 2026-10-18 12:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import numpy as np
+import sqlalchemy as sa
+
+from app.config import settings
+from app.verification.codec import decode_embedding
+from app.verification.vector import to_vector_literal
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b7e2f9a1c4d'
+down_revision: Union[str, None] = 'e61dd1a8c845'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH = 1000
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    available = bind.execute(sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'vector'")).scalar()
+    if not available:
+        # The column only matters for EMBEDDING_STORE=pgvector; installs without the
+        # extension keep working on the LargeBinary column alone.
+        if settings.EMBEDDING_STORE == "pgvector":
+            raise RuntimeError("EMBEDDING_STORE=pgvector, but the pgvector extension is not available in this Postgres")
+        print("pgvector extension is not available, skipping face_embeddings.embedding_vec")
+        return
+
+    dim = settings.EMBED_DIM
+    op.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    op.execute(f"ALTER TABLE face_embeddings ADD COLUMN IF NOT EXISTS embedding_vec vector({dim})")
+
+    # Backfill from the stored bytes; rows of another dimension stay NULL.
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.text("SELECT id, embedding FROM face_embeddings WHERE id > :last_id ORDER BY id LIMIT :n"),
+            {"last_id": last_id, "n": BACKFILL_BATCH},
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        values = []
+        for emb_id, data in rows:
+            try:
+                emb = decode_embedding(data)
+            except ValueError:
+                continue
+            if emb.size == dim:
+                values.append({"id": emb_id, "vec": to_vector_literal(emb)})
+        if values:
+            bind.execute(sa.text("UPDATE face_embeddings SET embedding_vec = CAST(:vec AS vector) WHERE id = :id"), values)
+
+    if settings.PGVECTOR_INDEX == "ivfflat":
+        # ids have gaps after deletes, so size the lists by the actual row count.
+        count = bind.execute(sa.text("SELECT count(*) FROM face_embeddings WHERE embedding_vec IS NOT NULL")).scalar()
+        lists = max(1, int(np.sqrt(count)))
+        op.execute(f"CREATE INDEX IF NOT EXISTS ix_face_embeddings_embedding_vec ON face_embeddings "
+                   f"USING ivfflat (embedding_vec vector_l2_ops) WITH (lists = {lists})")
+    else:
+        op.execute("CREATE INDEX IF NOT EXISTS ix_face_embeddings_embedding_vec ON face_embeddings "
+                   "USING hnsw (embedding_vec vector_l2_ops)")
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_face_embeddings_embedding_vec")
+    op.execute("ALTER TABLE face_embeddings DROP COLUMN IF EXISTS embedding_vec")
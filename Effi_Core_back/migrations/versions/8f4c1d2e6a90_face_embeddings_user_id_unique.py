@@ -0,0 +1,38 @@
+"""face_embeddings.user_id unique
+
+Revision ID: 8f4c1d2e6a90
+Revises: 3b7e2f9a1c4d
+Create Date: 2026-10-18 13:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f4c1d2e6a90'
+down_revision: Union[str, None] = '3b7e2f9a1c4d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The model always declared user_id unique; the original migration created a plain
+    # index. Upserts (ON CONFLICT (user_id)) need the unique one. Keep the newest row per user.
+    op.execute("""
+        DELETE FROM face_pins WHERE emb_id IN (
+            SELECT a.id FROM face_embeddings a JOIN face_embeddings b ON a.user_id = b.user_id AND a.id < b.id
+        )
+    """)
+    op.execute("""
+        DELETE FROM face_embeddings a USING face_embeddings b WHERE a.user_id = b.user_id AND a.id < b.id
+    """)
+    op.drop_index(op.f('ix_face_embeddings_user_id'), table_name='face_embeddings')
+    op.create_index(op.f('ix_face_embeddings_user_id'), 'face_embeddings', ['user_id'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_face_embeddings_user_id'), table_name='face_embeddings')
+    op.create_index(op.f('ix_face_embeddings_user_id'), 'face_embeddings', ['user_id'], unique=False)
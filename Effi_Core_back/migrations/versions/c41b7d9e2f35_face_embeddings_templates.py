@@ -0,0 +1,48 @@
+"""face_embeddings.slot - several templates per user
+
+Revision ID: c41b7d9e2f35
+Revises: 8f4c1d2e6a90
+Create Date: 2026-10-18 15:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41b7d9e2f35'
+down_revision: Union[str, None] = '8f4c1d2e6a90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # A constant default makes ADD COLUMN a catalog-only change; every existing row is slot 0.
+    op.add_column('face_embeddings', sa.Column('slot', sa.SmallInteger(), server_default='0', nullable=False))
+    # The indexes are built without blocking writes. The new (user_id, slot) index must be in
+    # place before the old unique one is dropped, so the ON CONFLICT target always exists.
+    with op.get_context().autocommit_block():
+        op.execute("CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_face_embeddings_user_slot "
+                   "ON face_embeddings (user_id, slot)")
+        op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_face_embeddings_user_id_nonunique "
+                   "ON face_embeddings (user_id)")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_face_embeddings_user_id")
+        op.execute("ALTER INDEX ix_face_embeddings_user_id_nonunique RENAME TO ix_face_embeddings_user_id")
+
+
+def downgrade() -> None:
+    # Only the primary (oldest) template of each user survives the downgrade.
+    op.execute("""
+        DELETE FROM face_pins WHERE emb_id IN (
+            SELECT b.id FROM face_embeddings a JOIN face_embeddings b ON a.user_id = b.user_id AND a.id < b.id
+        )
+    """)
+    op.execute("""
+        DELETE FROM face_embeddings b USING face_embeddings a WHERE a.user_id = b.user_id AND a.id < b.id
+    """)
+    op.drop_index(op.f('ix_face_embeddings_user_id'), table_name='face_embeddings')
+    op.create_index(op.f('ix_face_embeddings_user_id'), 'face_embeddings', ['user_id'], unique=True)
+    op.drop_index('uq_face_embeddings_user_slot', table_name='face_embeddings')
+    op.drop_column('face_embeddings', 'slot')
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from app.verification.codec import (
+    FORMATS, HEADER, LEGACY, decode_embedding, embedding_model, encode_embedding, encoded_size, model_id, same_model,
+)
+
+DIM = 128
+MODEL = model_id("eager:test")
+
+
+@pytest.fixture
+def emb():
+    x = np.random.default_rng(0).standard_normal(DIM).astype(np.float32)
+    return x / np.linalg.norm(x)
+
+
+def test_legacy_round_trip(emb):
+    data = emb.tobytes()
+    assert len(data) == encoded_size(DIM, LEGACY)
+    np.testing.assert_array_equal(decode_embedding(data), emb)
+    assert embedding_model(data) == 0
+
+
+def test_float32_round_trip(emb):
+    data = encode_embedding(emb, FORMATS["float32"], MODEL)
+    assert len(data) == encoded_size(DIM, FORMATS["float32"]) == HEADER.itemsize + 4 * DIM
+    np.testing.assert_array_equal(decode_embedding(data), emb)
+    assert embedding_model(data) == MODEL
+
+
+def test_float16_round_trip(emb):
+    data = encode_embedding(emb, FORMATS["float16"], MODEL)
+    assert len(data) == encoded_size(DIM, FORMATS["float16"]) == HEADER.itemsize + 2 * DIM
+    decoded = decode_embedding(data)
+    assert decoded.dtype == np.float32
+    np.testing.assert_allclose(decoded, emb, atol=1e-3)
+    assert embedding_model(data) == MODEL
+
+
+def test_int8_round_trip(emb):
+    data = encode_embedding(emb, FORMATS["int8"], MODEL)
+    assert len(data) == encoded_size(DIM, FORMATS["int8"])
+    np.testing.assert_allclose(decode_embedding(data), emb, atol=np.abs(emb).max() / 127)
+
+
+def test_same_model():
+    assert same_model(MODEL, MODEL)
+    assert same_model(0, MODEL)
+    assert not same_model(model_id("eager:other"), MODEL)
+    stamps = np.array([MODEL, 0, model_id("eager:other")], dtype=np.uint32)
+    np.testing.assert_array_equal(same_model(stamps, MODEL), [True, True, False])